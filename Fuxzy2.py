@@ -6,38 +6,13 @@ import time
 from flask import Flask, request, send_file, jsonify
 import logging
 import re
+from code_mapping import apply_code_mappings
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
 output_file_path = 'movie_ratings.xlsx'
 
-# MR and CD mappings
-mr_mapping = {
-    "Suitable for general audiences": "G",
-    "Parental guidance recommended for younger viewers": "PG",
-    "Suitable for mature audiences": "M",
-    "Unsuitable for audiences under 13 years of age": "13",
-    "Restricted to persons 13 years and over": "R13",
-    "Restricted to persons 13 years and over unless accompanied by a parent or guardian": "RP13",
-    "Restricted to persons 15 years and over": "R15",
-    "Unsuitable for audiences under 16 years of age": "16",
-    "Restricted to persons 16 years and over": "R16",
-    "Restricted to persons 16 years and over unless accompanied by a parent or guardian": "RP16",
-    "Unsuitable for audiences under 18 years of age": "18",
-    "Restricted to persons 18 years and over": "R18",
-    "Restricted to persons 17 years and over unless accompanied by a parent or guardian": "RP18"
-}
-
-cd_mapping = {
-    "General": "G",
-    "Parental Guidance": "PG",
-    "Mature": "M",
-    "Unrestricted": "R13",
-    "R": "R",
-    "RP": "RP"
-}
-
 def wait_for_element(selector, timeout=10):
     start_time = time.time()
     while time.time() - start_time < timeout:
@@ -235,17 +210,10 @@ def upload_file():
                         'CD': 'N/A',
                     }
                 
-                # MR Mapping
-                mr_statement = details.get('MR', 'N/A')
-                details['MR'] = mr_mapping.get(mr_statement, mr_statement)  
-
-                # CD Mapping
-                cd_statement = details.get('CD', 'N/A')
-                details['CD'] = cd_mapping.get(cd_statement, cd_statement)
-
                 results.append(details)
 
-            results_df = pd.DataFrame(results)
+            # Map MR and CD statements to codes for the whole sheet at once
+            results_df = apply_code_mappings(pd.DataFrame(results))
             filename = 'movie_ratings.xlsx'
             results_df.to_excel(filename, index=False)
 
@@ -1,10 +1,14 @@
 import pandas as pd
 from bs4 import BeautifulSoup
 from helium import start_chrome, write, click, S, find_all, get_driver
+from selenium.common.exceptions import WebDriverException
 import time
 from datetime import datetime
 from flask import Flask, request, send_file, jsonify
 import logging
+from rate_limiter import rate_limiter
+from result_merge import merge_second_pass
+from result_columns import ResultColumns
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -103,16 +107,26 @@ def get_movie_details(movie_name, director_name, retries=3):
             time.sleep(5)  # Wait before retrying
     return None
 
+def submit_fvlb_search(fvlb_url, search_button):
+    # Searches are paced by the shared per-host token bucket. Only the submit itself is timed:
+    # waiting for results an empty search never shows, or a parsing error afterwards, says
+    # nothing about how the site is coping
+    rate_limiter.acquire(fvlb_url)
+    search_started = time.time()
+    try:
+        click(search_button)
+    except WebDriverException:
+        rate_limiter.record(fvlb_url, False, time.time() - search_started)
+        raise
+    rate_limiter.record(fvlb_url, True, time.time() - search_started)
+
 def nz_title_check(movie_names, retries=3):
-    browser = start_chrome('https://www.fvlb.org.nz/', headless=True)
+    fvlb_url = 'https://www.fvlb.org.nz/'
+    browser = start_chrome(fvlb_url, headless=True)
 
     all_movies_details = []
 
     for i, movie_name in enumerate(movie_names):
-        if i > 0 and i % 10 == 0:
-            logging.debug("1 minute of batch break - please wait")
-            time.sleep(60)  # 1 minute delay after every batch of 10 movies
-
         for attempt in range(retries):
             try:
                 search_title_input = S("#fvlb-input")
@@ -121,9 +135,10 @@ def nz_title_check(movie_names, retries=3):
 
                 write(movie_name, into=search_title_input)
                 click(exact_match_checkbox)
-                click(search_button)
+                submit_fvlb_search(fvlb_url, search_button)
 
-                if not wait_for_element(S('.result-title')):
+                found_results = wait_for_element(S('.result-title'))
+                if not found_results:
                     all_movies_details.append({
                         'title_name': movie_name,
                         'dir_name': 'N/A',
@@ -132,8 +147,6 @@ def nz_title_check(movie_names, retries=3):
                     })
                     break
 
-                time.sleep(3)  # 3 seconds delay between each movie search
-
                 movie_links = find_all(S('.result-title'))
                 exact_match_found = False
 
@@ -145,9 +158,10 @@ def nz_title_check(movie_names, retries=3):
 
                 if not exact_match_found:
                     write('', into=search_title_input)
-                    click(search_button)
+                    submit_fvlb_search(fvlb_url, search_button)
 
-                    if not wait_for_element(S('.result-title')):
+                    found_results = wait_for_element(S('.result-title'))
+                    if not found_results:
                         all_movies_details.append({
                             'title_name': movie_name,
                             'dir_name': 'N/A',
@@ -156,8 +170,6 @@ def nz_title_check(movie_names, retries=3):
                         })
                         break
 
-                    time.sleep(3)  # 3 seconds delay between each movie search
-
                     movie_links = find_all(S('.result-title'))
 
                     for link in movie_links:
@@ -231,7 +243,7 @@ def upload_file():
             director_names = df['Director_name'].tolist()
 
             # Process with scrapper 1
-            results = []
+            results = ResultColumns()
             for movie_name, director_name in zip(movie_names, director_names):
                 movie_details = get_movie_details(movie_name, director_name)
                 if movie_details:
@@ -246,20 +258,15 @@ def upload_file():
                         'label_issued_by': 'N/A'
                     })
 
-            results_df = pd.DataFrame(results)
+            results_df = results.to_frame()
             not_found = results_df[results_df['classification'] == 'N/A']
             not_found_list = not_found['movie_name'].tolist()
 
             # Process with scrapper 2 for those not found in scrapper 1
             additional_results = nz_title_check(not_found_list)
 
-            # Append additional results to the main results
-            for i, row in not_found.iterrows():
-                additional_result = next((item for item in additional_results if item['title_name'] == row['movie_name']), None)
-                if additional_result:
-                    results_df.loc[i, 'classification'] = additional_result['classification']
-                    results_df.loc[i, 'run_time'] = additional_result['runtime']
-                    results_df.loc[i, 'label_issued_by'] = 'N/A'  # Placeholder for scrapper 2, modify as needed
+            # Merge additional results into the main results on the normalized title
+            results_df = merge_second_pass(results_df, additional_results)
 
             # Save the combined results to an Excel file
             date_str = datetime.now().strftime("%Y-%m-%d")
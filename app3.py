@@ -1,10 +1,15 @@
 import pandas as pd
 from bs4 import BeautifulSoup
 from helium import start_chrome, write, click, S, find_all, get_driver
+from selenium.common.exceptions import WebDriverException
 import time
 from datetime import datetime
 from flask import Flask, request, send_file, jsonify
 import logging
+import job_storage
+from rate_limiter import rate_limiter
+from result_merge import merge_second_pass
+from result_columns import ResultColumns
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -103,16 +108,26 @@ def get_movie_details(movie_name, director_name, retries=3):
             time.sleep(5)  # Wait before retrying
     return None
 
+def submit_fvlb_search(fvlb_url, search_button):
+    # Searches are paced by the shared per-host token bucket. Only the submit itself is timed:
+    # waiting for results an empty search never shows, or a parsing error afterwards, says
+    # nothing about how the site is coping
+    rate_limiter.acquire(fvlb_url)
+    search_started = time.time()
+    try:
+        click(search_button)
+    except WebDriverException:
+        rate_limiter.record(fvlb_url, False, time.time() - search_started)
+        raise
+    rate_limiter.record(fvlb_url, True, time.time() - search_started)
+
 def nz_title_check(movie_names, retries=3):
-    browser = start_chrome('https://www.fvlb.org.nz/', headless=True)
+    fvlb_url = 'https://www.fvlb.org.nz/'
+    browser = start_chrome(fvlb_url, headless=True)
 
     all_movies_details = []
 
     for i, movie_name in enumerate(movie_names):
-        if i > 0 and i % 10 == 0:
-            logging.debug("1 minute of batch break - please wait")
-            time.sleep(60)  # 1 minute delay after every batch of 10 movies
-
         for attempt in range(retries):
             try:
                 search_title_input = S("#fvlb-input")
@@ -121,9 +136,10 @@ def nz_title_check(movie_names, retries=3):
 
                 write(movie_name, into=search_title_input)
                 click(exact_match_checkbox)
-                click(search_button)
+                submit_fvlb_search(fvlb_url, search_button)
 
-                if not wait_for_element(S('.result-title')):
+                found_results = wait_for_element(S('.result-title'))
+                if not found_results:
                     all_movies_details.append({
                         'title_name': movie_name,
                         'dir_name': 'N/A',
@@ -132,8 +148,6 @@ def nz_title_check(movie_names, retries=3):
                     })
                     break
 
-                time.sleep(3)  # 3 seconds delay between each movie search
-
                 movie_links = find_all(S('.result-title'))
                 exact_match_found = False
 
@@ -145,9 +159,10 @@ def nz_title_check(movie_names, retries=3):
 
                 if not exact_match_found:
                     write('', into=search_title_input)
-                    click(search_button)
+                    submit_fvlb_search(fvlb_url, search_button)
 
-                    if not wait_for_element(S('.result-title')):
+                    found_results = wait_for_element(S('.result-title'))
+                    if not found_results:
                         all_movies_details.append({
                             'title_name': movie_name,
                             'dir_name': 'N/A',
@@ -156,8 +171,6 @@ def nz_title_check(movie_names, retries=3):
                         })
                         break
 
-                    time.sleep(3)  # 3 seconds delay between each movie search
-
                     movie_links = find_all(S('.result-title'))
 
                     for link in movie_links:
@@ -225,8 +238,10 @@ def upload_file():
     try:
         file = request.files['file']
         if file.filename.endswith('.xlsx'):
-            # Save the uploaded file temporarily
-            temp_file_path = 'temp_upload.xlsx'
+            # Every upload gets its own directory, so concurrent requests never share files
+            job_storage.cleanup_untracked()
+            job_id = job_storage.new_job_id()
+            temp_file_path = job_storage.output_path(job_id, 'upload.xlsx')
             file.save(temp_file_path)
             
             # Process the Excel file
@@ -235,7 +250,7 @@ def upload_file():
             director_names = df['Director_name'].tolist()
 
             # Process with scrapper 1
-            results = []
+            results = ResultColumns()
             for movie_name, director_name in zip(movie_names, director_names):
                 movie_details = get_movie_details(movie_name, director_name)
                 if movie_details:
@@ -250,36 +265,36 @@ def upload_file():
                         'label_issued_by': 'N/A'
                     })
 
-            results_df = pd.DataFrame(results)
+            results_df = results.to_frame()
             not_found = results_df[results_df['classification'] == 'N/A']
             not_found_list = not_found['movie_name'].tolist()
 
             # Process with scrapper 2 for those not found in scrapper 1
             additional_results = nz_title_check(not_found_list)
 
-            # Append additional results to the main results
-            for i, row in not_found.iterrows():
-                additional_result = next((item for item in additional_results if item['title_name'] == row['movie_name']), None)
-                if additional_result:
-                    results_df.loc[i, 'classification'] = additional_result['classification']
-                    results_df.loc[i, 'run_time'] = additional_result['runtime']
-                    results_df.loc[i, 'label_issued_by'] = 'N/A'  # Placeholder for scrapper 2, modify as needed
+            # Merge additional results into the main results on the normalized title
+            results_df = merge_second_pass(results_df, additional_results)
 
-            # Save the combined results to the original file
-            results_df.to_excel(temp_file_path, index=False)
+            # Write under a temporary name and rename once the file is complete
+            result_path = job_storage.output_path(job_id, output_file_path)
+            results_df.to_excel(job_storage.working_path(result_path), index=False)
+            job_storage.publish(result_path)
 
             # Provide the updated file for download
             logging.info(f"Processed {len(movie_names)} movies. Found details for {len(results_df) - len(not_found)} movies.")
-            return jsonify({'download_url': f'/download/{temp_file_path}'})
+            return jsonify({'download_url': f'/download/{job_id}'})
         else:
             return jsonify({'error': 'Invalid file format, must be .xlsx'}), 400
     except Exception as e:
         logging.error(f"Error processing file: {e}")
         return jsonify({'error': str(e)}), 500   
     
-@app.route('/download/<filename>')
-def download_file(filename):
-    return send_file(filename, as_attachment=True)
+@app.route('/download/<job_id>')
+def download_file(job_id):
+    result_path = job_storage.find_output(job_id, output_file_path)
+    if result_path is None:
+        return jsonify({'error': 'No output for this upload.'}), 404
+    return send_file(result_path, as_attachment=True)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,75 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+
+from async_fetch import close_session
+from lookup_cache import recording_failures
+from row_executor import iter_ordered, row_failed, row_finished
+from stage_timing import timed
+
+# SCRAPER_ENGINE=threads runs lookups on the row_executor thread pool instead
+ENGINE = os.environ.get('SCRAPER_ENGINE', 'async')
+# Rows in flight at once. Each is a coroutine rather than a thread, so this can be far higher
+# than row_executor.MAX_WORKERS; the per-site limits still decide how many requests go out
+MAX_IN_FLIGHT = 32
+CLOSE_TIMEOUT = 10
+
+
+def async_enabled():
+    return ENGINE == 'async'
+
+
+class AsyncEngine:
+    # One event loop on its own thread, shared by every job in the process. Job workers hand
+    # rows to it and wait on the returned futures, so the job queue itself stays threaded
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='async-engine', daemon=True)
+                self._thread.start()
+                logging.debug("Async engine started its event loop")
+            return self._loop
+
+    def submit(self, coroutine):
+        # Returns a concurrent.futures.Future, so callers on other threads can block on it
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop())
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), loop).result(CLOSE_TIMEOUT)
+        except Exception as e:
+            logging.debug(f"Error closing the async HTTP session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(CLOSE_TIMEOUT)
+
+
+engine = AsyncEngine()
+
+
+def iter_results_async(rows, process_row, max_in_flight=MAX_IN_FLIGHT, on_error=None, on_done=None,
+                       checkpoint=None, dedupe_key=None, input_fields=None):
+    # iter_results for coroutine row handlers: same ordering, checkpoint and dedupe behaviour,
+    # with up to max_in_flight rows running on the engine's event loop
+    async def run(row):
+        try:
+            with timed('row'), recording_failures() as errors:
+                result = await process_row(*row)
+        except Exception as e:
+            return row_failed(row, e, on_error)
+        return row_finished(row, result, errors)
+
+    return iter_ordered(rows, lambda row: engine.submit(run(row)), max_in_flight, on_done, checkpoint, dedupe_key,
+                        input_fields)
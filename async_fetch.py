@@ -0,0 +1,79 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from blocking_io import cache_io, run_in
+from http_fetch import HEADERS, POOL_MAXSIZE, REQUEST_TIMEOUT, request_failed, response_received
+from page_cache import page_cache, replay_enabled
+from rate_limiter import rate_limiter
+from site_limits import async_site_slot
+from stage_timing import observe
+
+# One client session for every coroutine on the engine's event loop
+_session = None
+# Render threads of each browser pool
+_render_executors = {}
+
+
+def get_session():
+    # Must be called on the event loop that will use the session
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=POOL_MAXSIZE)
+        _session = aiohttp.ClientSession(connector=connector, headers=HEADERS,
+                                         timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def fetch_page_async(url):
+    # Coroutine counterpart of http_fetch.fetch_page: same rate limits, cache and metrics,
+    # but waiting for a token or a site slot yields to other lookups instead of blocking a thread.
+    # The page cache is SQLite and files on disk, so it is used from the cache I/O threads
+    if replay_enabled():
+        return await cache_io(page_cache.get, url)
+    delay = rate_limiter.reserve(url)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    observe('rate_limit', delay)
+    queued_at = time.time()
+    async with async_site_slot(url):
+        # Timed from when the request goes out, as in fetch_page
+        start_time = time.time()
+        observe('site_slot', start_time - queued_at)
+        try:
+            async with get_session().get(url) as response:
+                status = response.status
+                page_source = await response.text() if status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            request_failed(url, start_time, e)
+            return None
+        latency = time.time() - start_time
+    if not response_received(url, status, latency):
+        return None
+    await cache_io(page_cache.put, url, page_source)
+    return page_source
+
+
+def render_executor(browser_pool):
+    # A render holds one of the pool's browsers for its whole run, so the pool gets exactly as
+    # many threads as it has browsers. Only called from the event loop, so no locking is needed
+    executor = _render_executors.get(browser_pool)
+    if executor is None:
+        executor = _render_executors[browser_pool] = ThreadPoolExecutor(
+            max_workers=browser_pool.size, thread_name_prefix='render')
+    return executor
+
+
+async def render_async(browser_pool, url, ready):
+    # Chrome is driven through blocking WebDriver calls, so the render runs on a thread of
+    # its own pool rather than the default executor shared with everything else
+    return await run_in(render_executor(browser_pool), browser_pool.render, url, ready)
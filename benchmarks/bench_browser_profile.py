@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bench_pipeline import FIXTURE_SERVER, ROOT, free_port, wait_for_port
+
+DEFAULT_TITLES = ('Oppenheimer', 'Barbie', 'Dune')
+
+# Bytes and request count of everything the page loaded, as the page itself saw it
+RESOURCE_STATS_SCRIPT = '''
+const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+return [entries.length - 1, entries.reduce((total, entry) => total + (entry.transferSize || 0), 0)];
+'''
+
+
+def start_fixtures():
+    # Serves the recorded pages, with stand-in stylesheets, fonts and images, on local ports and
+    # points the scrapers at them, so the profiles can be compared without network access.
+    # Must run before the scraper modules are imported, as they read the site URLs on import
+    ports = {'classificationoffice': free_port(), 'fvlb': free_port()}
+    server = subprocess.Popen([
+        sys.executable, FIXTURE_SERVER,
+        '--classificationoffice-port', str(ports['classificationoffice']),
+        '--fvlb-port', str(ports['fvlb']),
+    ], stdout=subprocess.DEVNULL)
+    for port in ports.values():
+        wait_for_port(port)
+    os.environ['CLASSIFICATION_OFFICE_URL'] = f"http://127.0.0.1:{ports['classificationoffice']}/"
+    os.environ['FVLB_URL'] = f"http://127.0.0.1:{ports['fvlb']}/"
+    return server
+
+
+def targets(titles):
+    # (url, readiness condition) for the pages the lookups actually render
+    import fvlb_client
+    from listing_extractor import SEARCH_URL
+
+    pages = []
+    for title in titles:
+        pages.append((SEARCH_URL + title.replace(' ', '+'), 'listings'))
+        pages.append((fvlb_client.search_url(title), 'result_title'))
+    return pages
+
+
+def process_tree_rss_mb(root_pid):
+    # Resident memory of chromedriver and every Chrome process under it (Linux /proc only)
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total_kb = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, ()))
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def run_profile(name, lean, pages, repeat):
+    from browser_pool import BrowserPool
+    from rate_limiter import rate_limiter
+
+    pool = BrowserPool(size=1, lean=lean)
+    timings = []
+    resources = []
+    transferred = []
+    ready = 0
+    peak_rss = 0.0
+    try:
+        with pool.browser() as browser:
+            for _ in range(repeat):
+                for url, condition in pages:
+                    rate_limiter.acquire(url)
+                    start_time = time.perf_counter()
+                    browser.get(url)
+                    ready += browser.wait_until_ready(condition)
+                    browser.page_source
+                    timings.append(time.perf_counter() - start_time)
+                    count, size = browser.driver.execute_script(RESOURCE_STATS_SCRIPT)
+                    resources.append(count)
+                    transferred.append(size)
+                    peak_rss = max(peak_rss, process_tree_rss_mb(browser.driver.service.process.pid))
+    finally:
+        pool.close()
+
+    return {
+        'profile': name,
+        'renders': len(timings),
+        'ready': ready,
+        'mean_seconds': round(statistics.mean(timings), 3),
+        'p50_seconds': round(statistics.median(timings), 3),
+        'max_seconds': round(max(timings), 3),
+        'mean_resources': round(statistics.mean(resources), 1),
+        'mean_transferred_kb': round(statistics.mean(transferred) / 1024, 1),
+        'peak_chrome_rss_mb': peak_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the lean Chrome profile with the stock one.')
+    parser.add_argument('--title', action='append', help='title to search for (repeatable)')
+    parser.add_argument('--repeat', type=int, default=3, help='times each page is rendered per profile')
+    parser.add_argument('--fixtures', action='store_true',
+                        help='render the recorded pages from a local fixture server instead of the live sites')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    server = start_fixtures() if args.fixtures else None
+    sys.path.insert(0, ROOT)
+    try:
+        pages = targets(args.title or DEFAULT_TITLES)
+        results = [run_profile('default', False, pages, args.repeat), run_profile('lean', True, pages, args.repeat)]
+    finally:
+        if server is not None:
+            server.terminate()
+    for result in results:
+        print(f"{result['profile']}: {result['renders']} renders ({result['ready']} ready), "
+              f"mean {result['mean_seconds']}s, p50 {result['p50_seconds']}s, max {result['max_seconds']}s, "
+              f"{result['mean_resources']} resources / {result['mean_transferred_kb']} KB per page, "
+              f"peak Chrome RSS {result['peak_chrome_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
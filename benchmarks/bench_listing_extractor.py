@@ -0,0 +1,91 @@
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from listing_extractor import PARSER, extract_listings  # noqa: E402
+
+FIXTURE_GLOB = os.path.join(ROOT, 'benchmarks', 'fixtures', 'classificationoffice', '*.html')
+
+
+def legacy_extract(page_source):
+    # The repeated-find() extraction the scrapers used before listing_extractor
+    soup = BeautifulSoup(page_source, 'html.parser')
+    records = []
+    for listing in soup.find_all('div', {'data-listing': ''}):
+        title_tag = listing.find('h3', class_='h2')
+        director_tag = listing.find('p', class_='small')
+        classification_tag = listing.find('p', class_='large mb-2')
+        mr_tag = listing.find('p', class_='large')
+        table = listing.find('table', class_='rating-result-table')
+        run_time = label_issued_by = label_issued_on = 'N/A'
+        if table:
+            lines = table.get_text(separator="\n", strip=True).split('\n')
+            for i, line in enumerate(lines):
+                if 'Running time:' in line:
+                    run_time = lines[i + 1].strip()
+                elif 'Label issued by:' in line:
+                    label_issued_by = lines[i + 1].strip()
+                elif 'Label issued on:' in line:
+                    label_issued_on = lines[i + 1].strip()
+        records.append((
+            title_tag.get_text(strip=True) if title_tag else None,
+            director_tag.get_text(strip=True) if director_tag else None,
+            classification_tag.get_text(strip=True) if classification_tag else 'N/A',
+            mr_tag.get_text(strip=True) if mr_tag else 'N/A',
+            run_time, label_issued_by, label_issued_on,
+        ))
+    return records
+
+
+def load_pages(use_page_cache):
+    pages = {}
+    for path in sorted(glob.glob(FIXTURE_GLOB)):
+        with open(path, encoding='utf-8') as f:
+            pages[os.path.basename(path)] = f.read()
+    if use_page_cache:
+        from page_cache import page_cache
+        for url, form, content_hash in page_cache.entries():
+            if 'classificationoffice' in url:
+                page_source = page_cache.get(url, form)
+                if page_source and 'data-listing' in page_source:
+                    pages[url] = page_source
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare legacy and single-pass listing extraction.')
+    parser.add_argument('--number', type=int, default=50, help='runs per page')
+    parser.add_argument('--page-cache', action='store_true', help='also benchmark pages saved in page_cache/')
+    args = parser.parse_args()
+
+    pages = load_pages(args.page_cache)
+    print(f"parser backend: {PARSER}, pages: {len(pages)}, runs per page: {args.number}")
+
+    legacy_total = new_total = 0.0
+    for name, page_source in pages.items():
+        legacy = legacy_extract(page_source)
+        new = [tuple(listing) for listing in extract_listings(page_source)]
+        if legacy != new:
+            print(f"  MISMATCH on {name}: legacy={len(legacy)} new={len(new)} listings")
+
+        legacy_time = timeit.timeit(lambda: legacy_extract(page_source), number=args.number) / args.number
+        new_time = timeit.timeit(lambda: extract_listings(page_source), number=args.number) / args.number
+        legacy_total += legacy_time
+        new_total += new_time
+        print(f"  {name}: {len(new)} listings, legacy {legacy_time * 1000:.2f} ms, "
+              f"single-pass {new_time * 1000:.2f} ms ({legacy_time / new_time:.1f}x)")
+
+    if pages:
+        print(f"total: legacy {legacy_total * 1000:.2f} ms, single-pass {new_total * 1000:.2f} ms "
+              f"({legacy_total / new_total:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import importlib
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook, load_workbook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_SERVER = os.path.join(ROOT, 'benchmarks', 'fixture_server.py')
+
+APPS = {
+    'movie': 'version1moviesfinal',
+    'series': 'v1seasonNo',
+}
+
+# Episodes and directors as listed in fixtures/classificationoffice/season_listings.html
+SERIES_EPISODES = (
+    ('Pilot', 'Jane Campion'),
+    ('The Long Night', 'Taika Waititi'),
+    ('Crossroads', 'Niki Caro'),
+    ('Homecoming', 'Jane Campion'),
+    ('Fault Lines', 'Lee Tamahori'),
+    ('Aftermath', 'Taika Waititi'),
+    ('Dead Reckoning', 'Niki Caro'),
+    ('Low Tide', 'Jane Campion'),
+    ('Signal Fire', 'Lee Tamahori'),
+    ('Endgame', 'Taika Waititi'),
+)
+
+# Regression checks against a baseline run: relative change allowed before failing
+DEFAULT_TOLERANCE = 0.10
+JOB_TIMEOUT = 3600
+POLL_INTERVAL = 0.2
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Fixture server did not start on port {port}")
+
+
+def write_movie_sheet(path, rows):
+    # Found, featured, FVLB-only and missing titles in a fixed mix
+    kinds = (('listed', 'Christopher Nolan'), ('listed', 'Christopher Nolan'), ('featured', 'Christopher Nolan'),
+             ('fvlb', 'Fixture Director'), ('unknown', 'Nobody Known'))
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['Movie_name', 'Director_name'])
+    for i in range(rows):
+        kind, director = kinds[i % len(kinds)]
+        sheet.append([f'Bench {kind} {i}', director])
+    workbook.save(path)
+
+
+def write_series_sheet(path, rows):
+    # Whole seasons of the fixture episodes, with every fifth season missing from both sites
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['Season_name', 'Season_number', 'Episode_number', 'Episode_name', 'Director_name'])
+    for i in range(rows):
+        season, episode = divmod(i, len(SERIES_EPISODES))
+        name = f'Unknown Show {season}' if season % 5 == 4 else f'Bench Show {season}'
+        episode_name, director = SERIES_EPISODES[episode]
+        sheet.append([name, 1, episode + 1, episode_name, director])
+    workbook.save(path)
+
+
+SHEET_WRITERS = {
+    'movie': write_movie_sheet,
+    'series': write_series_sheet,
+}
+
+
+def configure_limits(hosts, throttle):
+    # The fixture hosts get the limits of the sites they stand in for, unless throttling is off
+    from rate_limiter import DEFAULT_RATE_LIMIT, RATE_LIMITS
+    from site_limits import DEFAULT_SITE_LIMIT, SITE_LIMITS
+
+    for host, real_host in hosts.items():
+        if throttle:
+            RATE_LIMITS[host] = RATE_LIMITS.get(real_host, DEFAULT_RATE_LIMIT)
+            SITE_LIMITS[host] = SITE_LIMITS.get(real_host, DEFAULT_SITE_LIMIT)
+        else:
+            RATE_LIMITS[host] = {'rate': 10000.0, 'burst': 10000, 'adaptive': False}
+            SITE_LIMITS[host] = 64
+
+
+def count_found(path):
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows)
+        column = header.index('classification')
+        return sum(1 for row in rows if row[column] not in (None, 'N/A'))
+    finally:
+        workbook.close()
+
+
+def run(args):
+    ports = {'classificationoffice': free_port(), 'fvlb': free_port()}
+    server = subprocess.Popen([
+        sys.executable, FIXTURE_SERVER,
+        '--classificationoffice-port', str(ports['classificationoffice']),
+        '--fvlb-port', str(ports['fvlb']),
+        '--latency-ms', str(args.latency_ms),
+    ], stdout=subprocess.DEVNULL)
+    try:
+        for port in ports.values():
+            wait_for_port(port)
+
+        # Everything the app writes (jobs DB, lookup cache, page cache, outputs) goes to a
+        # scratch directory, so every run starts cold and nothing touches the checkout
+        workdir = tempfile.mkdtemp(prefix='bench-')
+        os.chdir(workdir)
+        os.environ['CLASSIFICATION_OFFICE_URL'] = f"http://127.0.0.1:{ports['classificationoffice']}/"
+        os.environ['FVLB_URL'] = f"http://127.0.0.1:{ports['fvlb']}/"
+        os.environ['SCRAPER_BROWSER'] = '0'
+        os.environ['SCRAPER_ENGINE'] = args.engine
+        sys.path.insert(0, ROOT)
+
+        configure_limits({
+            f"127.0.0.1:{ports['classificationoffice']}": 'www.classificationoffice.govt.nz',
+            f"127.0.0.1:{ports['fvlb']}": 'www.fvlb.org.nz',
+        }, throttle=not args.no_throttle)
+
+        upload_path = os.path.join(workdir, 'bench_upload.xlsx')
+        SHEET_WRITERS[args.app](upload_path, args.rows)
+
+        app_module = importlib.import_module(APPS[args.app])
+        from stage_timing import summary_since
+
+        client = app_module.app.test_client()
+        with open(upload_path, 'rb') as f:
+            response = client.post('/upload', data={'file': (f, 'bench_upload.xlsx')},
+                                   content_type='multipart/form-data')
+        job_id = response.get_json()['job_id']
+
+        deadline = time.time() + JOB_TIMEOUT
+        while True:
+            status = client.get(f'/jobs/{job_id}').get_json()
+            if status['status'] in ('done', 'failed'):
+                break
+            if time.time() > deadline:
+                raise RuntimeError(f"Benchmark job did not finish within {JOB_TIMEOUT} seconds")
+            time.sleep(POLL_INTERVAL)
+
+        job = app_module.job_queue.get(job_id)
+        elapsed = job['finished_at'] - job['started_at']
+        # Report fetch stages under the site name rather than the fixture server's random port
+        hosts = {f"fetch.127.0.0.1:{port}": f"fetch.{site}" for site, port in ports.items()}
+        stages = {hosts.get(stage, stage): stats for stage, stats in summary_since().items()}
+
+        return {
+            'variant': args.variant or args.app,
+            'app': args.app,
+            'engine': args.engine,
+            'status': status['status'],
+            'rows': args.rows,
+            'rows_found': count_found(job['output_path']) if status['status'] == 'done' else None,
+            'fetches_saved': status.get('fetches_saved'),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(args.rows / elapsed, 2) if elapsed else None,
+            'throttled': not args.no_throttle,
+            'latency_ms': args.latency_ms,
+            'stages': stages,
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def compare(report, baseline, tolerance):
+    # Throughput, memory and correctness gate the run; stage percentiles are informational
+    # because they are bucket bounds
+    regressions = []
+    for setting in ('app', 'engine', 'rows', 'throttled', 'latency_ms'):
+        if report[setting] != baseline.get(setting, 'threads' if setting == 'engine' else None):
+            regressions.append(f"baseline was run with {setting}={baseline.get(setting)}, not {report[setting]}")
+    if regressions:
+        return regressions
+    if report['rows_per_second'] < baseline['rows_per_second'] * (1 - tolerance):
+        regressions.append(f"rows/s {baseline['rows_per_second']} -> {report['rows_per_second']}")
+    if report['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {baseline['peak_rss_mb']} MB -> {report['peak_rss_mb']} MB")
+    if report['rows_found'] != baseline['rows_found']:
+        regressions.append(f"rows found {baseline['rows_found']} -> {report['rows_found']}")
+    for name, stage in report['stages'].items():
+        before = baseline['stages'].get(name)
+        if before and before['p95'] != stage['p95']:
+            print(f"  note: {name} p95 {before['p95']}s -> {stage['p95']}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an upload end to end against local fixture pages.')
+    parser.add_argument('--app', choices=sorted(APPS), default='movie')
+    parser.add_argument('--engine', choices=('async', 'threads'), default='async',
+                        help='run lookups as coroutines or on the row thread pool')
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='delay the fixture server adds per response')
+    parser.add_argument('--no-throttle', action='store_true', help='lift the per-site rate and concurrency limits')
+    parser.add_argument('--variant', help='label stored with the results, e.g. a branch name')
+    parser.add_argument('--output', help='write the report as JSON to this path')
+    parser.add_argument('--baseline', help='report from an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    report = run(args)
+    print(f"{report['variant']} ({report['engine']}): {report['rows']} rows, {report['status']} in {report['elapsed_seconds']}s "
+          f"({report['rows_per_second']} rows/s), {report['rows_found']} found, "
+          f"{report['fetches_saved']} fetches saved, peak RSS {report['peak_rss_mb']} MB")
+    for name, stage in sorted(report['stages'].items()):
+        print(f"  {name}: {stage['count']} samples, mean {stage['mean_seconds']}s, "
+              f"p50 <= {stage['p50']}s, p95 <= {stage['p95']}s")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"REGRESSION against {baseline.get('variant')}: " + '; '.join(regressions))
+            return 1
+        print(f"no regression against {baseline.get('variant')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, unquote_plus, urlparse
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Search words in a query pick the page a search returns, so a benchmark sheet
+# can mix found, featured and missing titles. First match wins
+CLASSIFICATION_OFFICE_PAGES = (
+    ('unknown', 'empty_results.html'),
+    ('fvlb', 'empty_results.html'),
+    ('featured', 'featured_results.html'),
+    ('season', 'season_listings.html'),
+)
+CLASSIFICATION_OFFICE_DEFAULT = 'search_listings.html'
+FVLB_MISSING_WORD = 'unknown'
+
+# Stand-in subresources (content type, size in bytes), so a browser rendering a fixture page
+# downloads roughly what it would from the live sites. The stylesheet pulls in a web font
+ASSET_PREFIXES = ('/assets/', '/themes/')
+ASSET_TYPES = {
+    '.css': ('text/css', 40_000),
+    '.js': ('application/javascript', 90_000),
+    '.svg': ('image/svg+xml', 4_000),
+    '.png': ('image/png', 20_000),
+    '.woff2': ('font/woff2', 60_000),
+}
+ASSET_FONT_URL = '/assets/fonts/body.woff2?v=2'
+
+
+def load_fixture(site, name):
+    with open(os.path.join(FIXTURE_DIR, site, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def render(site, name, query):
+    # Fixtures echo the search back the way the live pages do
+    return (load_fixture(site, name)
+            .replace('__QUERY__', query)
+            .replace('__SLUG__', quote(query, safe='')))
+
+
+def classification_office_page(url):
+    params = parse_qs(url.query)
+    query = params.get('search', [''])[0]
+    if url.path.rstrip('/') != '/find-a-rating':
+        return None
+    if int(params.get('page', ['1'])[0]) > 1:
+        return render('classificationoffice', 'empty_results.html', query)
+    for word, name in CLASSIFICATION_OFFICE_PAGES:
+        if word in query.lower():
+            return render('classificationoffice', name, query)
+    return render('classificationoffice', CLASSIFICATION_OFFICE_DEFAULT, query)
+
+
+def fvlb_page(url):
+    parts = [part for part in url.path.split('/') if part]
+    if len(parts) == 2 and parts[0] == 'search':
+        query = unquote_plus(parts[1])
+        name = 'search_empty.html' if FVLB_MISSING_WORD in query.lower() else 'search_results.html'
+        return render('fvlb', name, query)
+    if len(parts) == 2 and parts[0] == 'film':
+        return render('fvlb', 'detail.html', unquote(parts[1]))
+    return None
+
+
+def asset(path):
+    # Returns (content type, body) for a stand-in asset, padded to its size
+    content_type, size = ASSET_TYPES.get(os.path.splitext(path)[1], (None, 0))
+    if content_type is None or not path.startswith(ASSET_PREFIXES):
+        return None
+    if content_type == 'text/css':
+        head = f"@font-face{{font-family:body;src:url({ASSET_FONT_URL})}}body{{font-family:body}}/*"
+        return content_type, (head + ' ' * (size - len(head) - 2) + '*/').encode('utf-8')
+    if content_type == 'application/javascript':
+        return content_type, ('/*' + ' ' * (size - 4) + '*/').encode('utf-8')
+    if content_type == 'image/svg+xml':
+        head = '<svg xmlns="http://www.w3.org/2000/svg" width="1" height="1"><!--'
+        return content_type, (head + ' ' * (size - len(head) - 9) + '--></svg>').encode('utf-8')
+    return content_type, bytes(size)
+
+
+SITES = {
+    'classificationoffice': classification_office_page,
+    'fvlb': fvlb_page,
+}
+
+
+def make_handler(site, latency):
+    page_for = SITES[site]
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            url = urlparse(self.path)
+            static = asset(url.path)
+            if static is not None:
+                content_type, body = static
+                self.send_response(200)
+            else:
+                page = page_for(url)
+                body = (page if page is not None else 'Not found').encode('utf-8')
+                self.send_response(200 if page is not None else 404)
+                content_type = 'text/html; charset=utf-8'
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FixtureHandler
+
+
+def serve(site, port, latency=0.0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(site, latency))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name=f'fixtures-{site}', daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve recorded classificationoffice and FVLB pages locally.')
+    parser.add_argument('--classificationoffice-port', type=int, default=8701)
+    parser.add_argument('--fvlb-port', type=int, default=8702)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='delay added to every response')
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000.0
+    serve('classificationoffice', args.classificationoffice_port, latency)
+    serve('fvlb', args.fvlb_port, latency)
+    print(f"CLASSIFICATION_OFFICE_URL=http://127.0.0.1:{args.classificationoffice_port}/ "
+          f"FVLB_URL=http://127.0.0.1:{args.fvlb_port}/", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# SQLite and file reads and writes of the page and lookup caches. They are short, so a few
+# threads are enough, and keeping them apart from the Chrome renders means a cache hit never
+# waits behind a page load
+CACHE_IO_WORKERS = 4
+
+_cache_io = ThreadPoolExecutor(max_workers=CACHE_IO_WORKERS, thread_name_prefix='cache-io')
+
+
+async def run_in(executor, function, *args):
+    # Like asyncio.to_thread, but on the given executor. The caller's context goes along so
+    # failures recorded on the thread still reach the row and lookup that made the call
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(context.run, function, *args))
+
+
+async def cache_io(function, *args):
+    return await run_in(_cache_io, function, *args)
@@ -0,0 +1,339 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from helium import start_chrome
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+
+from browser_profile import LEAN_PROFILE, block_resources, chrome_options
+from lookup_cache import mark_failed
+from page_cache import page_cache, replay_enabled
+import metrics
+from rate_limiter import rate_limiter
+from readiness import wait_until_ready, wait_until_tab_ready
+from site_limits import site_of, site_slot
+from stage_timing import observe, timed
+
+# Number of warm headless Chrome instances one process may keep open
+POOL_SIZE = 3
+# Recycle a driver after this many page loads so Chrome memory doesn't creep up
+MAX_PAGES_PER_DRIVER = 50
+# How long a lookup waits for a free browser before giving up
+CHECKOUT_TIMEOUT = 120
+# SCRAPER_BROWSER=0 turns the Chrome fallback off; pages that need it count as not found.
+# Used by the offline benchmark, where no Chrome is available or wanted
+BROWSER_ENABLED = os.environ.get('SCRAPER_BROWSER', '1') != '0'
+# SCRAPER_BROWSER_TABS=N renders in N tabs of one shared Chrome instead of a Chrome per lookup
+BROWSER_TABS = int(os.environ.get('SCRAPER_BROWSER_TABS', '0'))
+# A tab is closed and replaced after this many page loads, which also frees its renderer process
+MAX_PAGES_PER_TAB = 50
+
+
+class PooledBrowser:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.time()
+
+    def get(self, url):
+        self.pages += 1
+        self.driver.get(url)
+
+    def wait_until_ready(self, ready):
+        return wait_until_ready(self.driver, ready)
+
+    @property
+    def page_source(self):
+        return self.driver.page_source
+
+
+class BrowserPool:
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_DRIVER, headless=True, lean=LEAN_PROFILE):
+        self.size = size
+        self.max_pages = max_pages
+        self.headless = headless
+        # Lean profile: no images, fonts, stylesheets or trackers (see browser_profile)
+        self.lean = lean
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        # helium keeps a module-level "current driver", so launches are serialised
+        self._launch_lock = threading.Lock()
+        self._closed = False
+        self._in_use = 0
+        self._stats_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _launch(self):
+        with self._launch_lock, timed('browser.launch'):
+            driver = start_chrome(headless=self.headless, options=self._chrome_options())
+            block_resources(driver, self.lean)
+        metrics.increment('scraper_browser_launches_total')
+        logging.debug("Browser pool launched a new Chrome instance")
+        return PooledBrowser(driver)
+
+    def _chrome_options(self):
+        return chrome_options(self.lean)
+
+    def _is_healthy(self, browser):
+        try:
+            browser.driver.execute_script("return document.readyState")
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, browser, reason='error'):
+        metrics.increment('scraper_browser_discards_total', reason=reason)
+        try:
+            browser.driver.quit()
+        except Exception as e:
+            logging.debug(f"Error quitting pooled browser: {e}")
+
+    def checkout(self, timeout=CHECKOUT_TIMEOUT):
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No browser available after {timeout} seconds")
+
+        try:
+            while True:
+                try:
+                    browser = self._idle.get_nowait()
+                except queue.Empty:
+                    browser = self._launch()
+                    break
+                if self._is_healthy(browser):
+                    break
+                logging.debug("Browser pool dropped an unresponsive Chrome instance")
+                self._discard(browser, 'unresponsive')
+        except Exception:
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self._in_use += 1
+        return browser
+
+    def checkin(self, browser, discard=False):
+        with self._stats_lock:
+            self._in_use -= 1
+        try:
+            if discard:
+                self._discard(browser, 'error')
+            elif self._closed or browser.pages >= self.max_pages:
+                self._discard(browser, 'recycled')
+            else:
+                self._idle.put(browser)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def browser(self, timeout=CHECKOUT_TIMEOUT):
+        browser = self.checkout(timeout)
+        discard = False
+        try:
+            yield browser
+        except WebDriverException:
+            # The driver itself failed; don't hand it to the next lookup
+            discard = True
+            raise
+        finally:
+            self.checkin(browser, discard=discard)
+
+    def render(self, url, ready):
+        # Load a page in a pooled browser, wait for the named readiness condition
+        # and return the rendered HTML
+        if replay_enabled():
+            return page_cache.get(url)
+        if not BROWSER_ENABLED:
+            return None
+        observe('rate_limit', rate_limiter.acquire(url))
+        with site_slot(url), self.browser() as browser:
+            # Only the load itself tells us how the site is doing; waiting for a slot or a
+            # browser is our own queueing
+            start_time = time.time()
+            try:
+                with timed('browser.load'):
+                    browser.get(url)
+            except WebDriverException:
+                rate_limiter.record(url, False, time.time() - start_time)
+                raise
+            load_seconds = time.time() - start_time
+            with timed('browser.wait'):
+                ok = browser.wait_until_ready(ready)
+            with timed('browser.page_source'):
+                page_source = browser.page_source
+        # A page that never got ready isn't a site error: an empty search never shows its results markup
+        rate_limiter.record(url, True, load_seconds)
+        if not ok:
+            # Could be an error page as easily as an empty result, so it isn't cached as "not found"
+            mark_failed('NotReady')
+        metrics.increment('scraper_requests_total', site=site_of(url), via='browser',
+                          outcome='ok' if ok else 'not_ready')
+        page_cache.put(url, page_source)
+        return page_source
+
+    def stats(self):
+        with self._stats_lock:
+            return {'idle': self._idle.qsize(), 'in_use': self._in_use}
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(browser, 'closed')
+
+
+class SharedChrome:
+    # One Chrome whose tabs serve different lookups at the same time. WebDriver only talks to
+    # one window at a time, so every command switches to its tab under a lock. Chrome runs with
+    # the "none" page load strategy, so a command never waits for a page and the lock is only
+    # held for the length of one command while the tabs load in parallel
+    def __init__(self, driver):
+        self.driver = driver
+        self._lock = threading.Lock()
+        # The window Chrome starts with is never handed out, so closing every lookup tab
+        # doesn't end the session
+        self._current = driver.current_window_handle
+
+    def run(self, handle, command):
+        with self._lock:
+            if self._current != handle:
+                self._current = None
+                self.driver.switch_to.window(handle)
+                self._current = handle
+            return command(self.driver)
+
+    def open_tab(self):
+        with self._lock:
+            self._current = None
+            self.driver.switch_to.new_window('tab')
+            self._current = self.driver.current_window_handle
+            return self._current
+
+    def close_tab(self, handle):
+        with self._lock:
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            finally:
+                self._current = None
+
+    def is_healthy(self):
+        # A session-level command, so a crashed tab doesn't make the whole browser look dead
+        try:
+            with self._lock:
+                self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.debug(f"Error quitting shared browser: {e}")
+
+
+class BrowserTab:
+    # Stands in for a PooledBrowser: one lookup's tab in a SharedChrome
+    def __init__(self, chrome, handle):
+        self.chrome = chrome
+        self.handle = handle
+        self.pages = 0
+        self.created_at = time.time()
+        self._previous_page = None
+
+    def run(self, command):
+        return self.chrome.run(self.handle, command)
+
+    def get(self, url):
+        self.pages += 1
+
+        def navigate(driver):
+            # Start the load and return straight away; wait_until_ready waits for this
+            # element to go stale before it looks at the new page
+            previous_page = driver.find_element(By.TAG_NAME, 'html')
+            driver.get(url)
+            return previous_page
+
+        self._previous_page = self.run(navigate)
+
+    def wait_until_ready(self, ready):
+        return wait_until_tab_ready(self, ready, stale=self._previous_page)
+
+    @property
+    def page_source(self):
+        return self.run(lambda driver: driver.page_source)
+
+
+class TabbedBrowserPool(BrowserPool):
+    # Checks out tabs of one shared Chrome rather than whole Chrome instances, so N concurrent
+    # lookups cost one browser process. A tab that errors or stops responding is closed and
+    # replaced on its own; Chrome is only restarted when the browser itself stops responding
+    def __init__(self, tabs=BROWSER_TABS, max_pages=MAX_PAGES_PER_TAB, headless=True, lean=LEAN_PROFILE):
+        super().__init__(size=tabs, max_pages=max_pages, headless=headless, lean=lean)
+        self._chrome = None
+        self._chrome_lock = threading.Lock()
+
+    def _chrome_options(self):
+        return chrome_options(self.lean, page_load_strategy='none')
+
+    def _shared_chrome(self):
+        with self._chrome_lock:
+            if self._chrome is not None and not self._chrome.is_healthy():
+                logging.debug("Browser pool restarting an unresponsive shared Chrome")
+                self._quit_chrome('unresponsive')
+            if self._chrome is None:
+                self._chrome = SharedChrome(super()._launch().driver)
+            return self._chrome
+
+    def _quit_chrome(self, reason):
+        metrics.increment('scraper_browser_discards_total', reason=reason)
+        self._chrome.quit()
+        self._chrome = None
+
+    def _launch(self):
+        chrome = self._shared_chrome()
+        with timed('browser.open_tab'):
+            tab = BrowserTab(chrome, chrome.open_tab())
+            tab.run(lambda driver: block_resources(driver, self.lean))
+        metrics.increment('scraper_browser_tabs_opened_total')
+        return tab
+
+    def _is_healthy(self, tab):
+        # Tabs left over from a Chrome that has since been restarted are dropped
+        if tab.chrome is not self._chrome:
+            return False
+        try:
+            tab.run(lambda driver: driver.execute_script("return document.readyState"))
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, tab, reason='error'):
+        metrics.increment('scraper_browser_tabs_closed_total', reason=reason)
+        if tab.chrome is not self._chrome:
+            return
+        try:
+            tab.chrome.close_tab(tab.handle)
+        except Exception as e:
+            logging.debug(f"Error closing browser tab: {e}")
+
+    def close(self):
+        super().close()
+        with self._chrome_lock:
+            if self._chrome is not None:
+                self._quit_chrome('closed')
+
+
+def new_browser_pool():
+    if BROWSER_TABS > 0:
+        return TabbedBrowserPool(BROWSER_TABS)
+    return BrowserPool()
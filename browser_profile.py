@@ -0,0 +1,74 @@
+import logging
+import os
+
+from selenium.webdriver import ChromeOptions
+
+# SCRAPER_BROWSER_PROFILE=default starts Chrome with its stock settings instead of the lean profile
+LEAN_PROFILE = os.environ.get('SCRAPER_BROWSER_PROFILE', 'lean') != 'default'
+
+# Lookups only read DOM text, so nothing a page needs for display is worth downloading
+BLOCKED_EXTENSIONS = [
+    # Images
+    'png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'avif',
+    # Web fonts
+    'woff', 'woff2', 'ttf', 'otf', 'eot',
+    # Stylesheets
+    'css',
+]
+
+# Analytics and tracking
+BLOCKED_HOSTS = [
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*facebook.net*',
+    '*hotjar.com*', '*clarity.ms*',
+]
+
+# Chrome matches a pattern against the whole URL, with '*' as the only wildcard. Assets are
+# often versioned (main.css?v=3), so each extension is blocked with and without a query string
+BLOCKED_URLS = [
+    pattern for extension in BLOCKED_EXTENSIONS for pattern in (f'*.{extension}', f'*.{extension}?*')
+] + BLOCKED_HOSTS
+
+# Chrome content settings (2 = block). Fonts, stylesheets and trackers have no content
+# setting, so they are blocked by URL through CDP instead
+LEAN_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.default_content_setting_values.notifications': 2,
+}
+
+LEAN_ARGUMENTS = [
+    '--disable-extensions',
+    '--disable-gpu',
+    '--window-size=1024,768',
+    '--blink-settings=imagesEnabled=false',
+    '--mute-audio',
+    '--no-first-run',
+]
+
+
+def chrome_options(lean=LEAN_PROFILE, page_load_strategy=None):
+    # None keeps helium's defaults
+    if not lean and page_load_strategy is None:
+        return None
+    options = ChromeOptions()
+    if lean:
+        for argument in LEAN_ARGUMENTS:
+            options.add_argument(argument)
+        options.add_experimental_option('prefs', dict(LEAN_PREFS))
+        # Readiness waits look for the elements they need, so there's no point waiting
+        # for subresources before handing the page over
+        options.page_load_strategy = 'eager'
+    if page_load_strategy is not None:
+        options.page_load_strategy = page_load_strategy
+    return options
+
+
+def block_resources(driver, lean=LEAN_PROFILE):
+    # Request blocking is per tab, so this runs for every new tab as well as a new driver
+    if not lean:
+        return
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+    except Exception as e:
+        # Images are still blocked by the content settings
+        logging.debug(f"Could not set blocked URLs on the browser: {e}")
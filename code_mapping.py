@@ -0,0 +1,75 @@
+# MR statements as printed on a rating, mapped to their codes
+MR_MAPPING = {
+    "Suitable for general audiences": "G",
+    "Parental guidance recommended for younger viewers": "PG",
+    "Suitable for mature audiences": "M",
+    "Unsuitable for audiences under 13 years of age": "13",
+    "Restricted to persons 13 years and over": "R13",
+    "Restricted to persons 13 years and over unless accompanied by a parent or guardian": "RP13",
+    "Restricted to persons 15 years and over": "R15",
+    "Unsuitable for audiences under 16 years of age": "16",
+    "Restricted to persons 16 years and over": "R16",
+    "Restricted to persons 16 years and over unless accompanied by a parent or guardian": "RP16",
+    "Unsuitable for audiences under 18 years of age": "18",
+    "Restricted to persons 18 years and over": "R18",
+    "Restricted to persons 17 years and over unless accompanied by a parent or guardian": "RP18"
+}
+
+# Classification names mapped to their codes (only Fuxzy2.py maps CD)
+CD_MAPPING = {
+    "General": "G",
+    "Parental Guidance": "PG",
+    "Mature": "M",
+    "Unrestricted": "R13",
+    "R": "R",
+    "RP": "RP"
+}
+
+# Result column -> mapping applied to it
+CODE_MAPPINGS = {
+    'MR': MR_MAPPING,
+    'CD': CD_MAPPING,
+}
+
+
+def normalize_statement(statement):
+    # Spacing and capitalisation vary between pages, the code doesn't
+    return ' '.join(str(statement).split()).casefold()
+
+
+_LOOKUPS = {
+    column: {normalize_statement(statement): code for statement, code in mapping.items()}
+    for column, mapping in CODE_MAPPINGS.items()
+}
+
+
+def map_codes(values, column):
+    # Each distinct statement is normalized once; unknown statements are kept as they are
+    lookup = _LOOKUPS[column]
+    codes = {value: lookup.get(normalize_statement(value), value) for value in values.dropna().unique()}
+    # Only a handful of distinct codes, so a categorical column is far smaller than object strings
+    return values.map(codes).astype('category')
+
+
+def apply_code_mappings(frame):
+    for column in CODE_MAPPINGS:
+        if column in frame.columns:
+            frame[column] = map_codes(frame[column], column)
+    return frame
+
+
+def map_statement(statement, column):
+    # Per-row lookup for streamed results; unknown statements are kept as they are
+    if statement is None:
+        return None
+    return _LOOKUPS[column].get(normalize_statement(statement), statement)
+
+
+def iter_mapped(results, columns):
+    # Post-processing stage between iter_results and the sink; each row is mapped as it
+    # arrives, so the sink gets it straight away and input order is kept
+    for row in results:
+        for column in columns:
+            # Rows from FVLB carry no statements; they show 'N/A' as they always have
+            row[column] = map_statement(row.get(column, 'N/A'), column)
+        yield row
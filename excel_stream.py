@@ -0,0 +1,51 @@
+from openpyxl import load_workbook
+
+MOVIE_COLUMNS = ('Movie_name', 'Director_name')
+SERIES_COLUMNS = ('Season_name', 'Season_number', 'Episode_number', 'Episode_name', 'Director_name')
+
+
+def cell_text(value):
+    if value is None:
+        return ''
+    # Excel stores every number as a float; keep "3" rather than "3.0" for season/episode numbers
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def count_rows(path):
+    # Read-only workbooks take this from the sheet's dimension tag without reading any cells.
+    # An upper bound: blank and formatting-only rows are counted here but skipped by iter_rows,
+    # which reports the exact count through on_total once it reaches the end of the sheet
+    workbook = load_workbook(path, read_only=True)
+    try:
+        max_row = workbook.active.max_row
+        return max(max_row - 1, 0) if max_row else None
+    finally:
+        workbook.close()
+
+
+def iter_rows(path, columns, on_total=None):
+    # Yields a tuple of strings per data row, holding only the requested columns.
+    # on_total(count) is called with the number of rows yielded once the sheet is exhausted
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        positions = {str(name).strip(): i for i, name in enumerate(header) if name is not None}
+        missing = [column for column in columns if column not in positions]
+        if missing:
+            raise KeyError(f"Missing column(s) in upload: {', '.join(missing)}")
+        indexes = [positions[column] for column in columns]
+
+        count = 0
+        for row in rows:
+            values = tuple(cell_text(row[i]) if i < len(row) else '' for i in indexes)
+            if not any(value.strip() for value in values):
+                continue  # Blank or formatting-only rows
+            count += 1
+            yield values
+        if on_total is not None:
+            on_total(count)
+    finally:
+        workbook.close()
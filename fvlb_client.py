@@ -0,0 +1,77 @@
+import os
+from urllib.parse import quote_plus, urljoin
+
+from bs4 import BeautifulSoup
+
+from listing_extractor import PARSER
+from lookup_steps import fetch_or_render
+from stage_timing import timed
+
+# Overridable so the offline benchmark can point the scrapers at a local fixture server
+FVLB_URL = os.environ.get('FVLB_URL', "https://www.fvlb.org.nz/")
+# Same results page the #fvlb-input form submits to
+FVLB_SEARCH_URL = urljoin(FVLB_URL, "search/")
+# A results page either lists .result-title entries or says the search found nothing
+SEARCH_PAGE_MARKERS = ('result-title', 'did not return any results')
+
+
+def search_url(title, exact=True):
+    url = FVLB_SEARCH_URL + quote_plus(title)
+    if exact:
+        # Equivalent of ticking #ExactSearch on the form
+        url += "?ExactSearch=true"
+    return url
+
+
+@timed('parse.fvlb_search')
+def parse_search_results(page_source):
+    # Returns (title text, detail page URL) for every .result-title on the page
+    soup = BeautifulSoup(page_source, PARSER)
+    results = []
+    for tag in soup.select('.result-title'):
+        anchor = tag if tag.name == 'a' else (tag.find('a') or tag.find_parent('a'))
+        href = anchor.get('href') if anchor else None
+        results.append((tag.get_text(strip=True), urljoin(FVLB_URL, href) if href else None))
+    return results
+
+
+@timed('parse.fvlb_detail')
+def parse_detail_page(page_source):
+    soup = BeautifulSoup(page_source, PARSER)
+
+    title_element = soup.find('h1')
+    director_element = soup.find('div', class_='film-director')
+    classification_element = soup.find('div', class_='film-classification')
+
+    runtime = 'N/A'
+    approved_elements = soup.find_all('div', class_='film-approved')
+    if len(approved_elements) > 1:
+        runtime = approved_elements[1].text.strip().replace('This title has a runtime of ', '').replace(' minutes.', '')
+
+    return {
+        'title_name': title_element.text.strip() if title_element else 'N/A',
+        'dir_name': director_element.text.strip().replace('Directed by ', '') if director_element else 'N/A',
+        'classification': classification_element.text.strip() if classification_element else 'N/A',
+        'runtime': runtime or 'N/A',
+    }
+
+
+def is_search_page(page_source):
+    # Anything else (a client-rendered shell, a block page) is rendered in Chrome, like a
+    # detail page without its film- markup
+    return bool(page_source) and any(marker in page_source for marker in SEARCH_PAGE_MARKERS)
+
+
+def is_detail_page(page_source):
+    return bool(page_source) and 'film-' in page_source
+
+
+def search_steps(title, browser_pool=None, exact=True):
+    # Lookup steps (see lookup_steps) for the (title, URL) search results
+    page_source = yield from fetch_or_render(search_url(title, exact), browser_pool, 'result_title', is_search_page)
+    return parse_search_results(page_source) if page_source else []
+
+
+def detail_page_steps(url, browser_pool=None):
+    return (yield from fetch_or_render(url, browser_pool, 'detail_h1', is_detail_page))
+
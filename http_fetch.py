@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from lookup_cache import mark_failed
+from page_cache import page_cache, replay_enabled
+from rate_limiter import rate_limiter
+from site_limits import site_of, site_slot
+from stage_timing import observe
+
+# Keep-alive connections held per host by the shared session
+POOL_MAXSIZE = 10
+REQUEST_TIMEOUT = 15
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/126.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Language': 'en-NZ,en;q=0.9',
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(HEADERS)
+            _session = session
+        return _session
+
+
+def request_failed(url, start_time, error):
+    # Bookkeeping for a request that never got a response; shared with fetch_page_async
+    latency = time.time() - start_time
+    rate_limiter.record(url, False, latency)
+    observe(f'fetch.{site_of(url)}', latency)
+    metrics.increment('scraper_requests_total', site=site_of(url), via='http', outcome=type(error).__name__)
+    logging.error(f"HTTP fetch failed for {url}: {error!r}")
+    mark_failed(error)
+
+
+def response_received(url, status, latency):
+    # Bookkeeping for a response; returns whether its page should be kept
+    observe(f'fetch.{site_of(url)}', latency)
+    metrics.increment('scraper_requests_total', site=site_of(url), via='http', outcome=str(status))
+    # 429 and 5xx mean the site wants us to slow down; a 404 is just a missing page
+    rate_limiter.record(url, status < 500 and status != 429, latency)
+    if status != 200:
+        logging.error(f"HTTP fetch for {url} returned status {status}")
+        if status != 404:
+            mark_failed(f'HTTP {status}')
+        return False
+    return True
+
+
+def fetch_page(url, timeout=REQUEST_TIMEOUT):
+    if replay_enabled():
+        return page_cache.get(url)
+    observe('rate_limit', rate_limiter.acquire(url))
+    queued_at = time.time()
+    with site_slot(url):
+        # Response time per host, timed from when the request goes out, so our own queueing
+        # for a site slot doesn't read as a slow site
+        start_time = time.time()
+        observe('site_slot', start_time - queued_at)
+        try:
+            response = get_session().get(url, timeout=timeout)
+        except requests.RequestException as e:
+            request_failed(url, start_time, e)
+            return None
+        latency = time.time() - start_time
+    if not response_received(url, response.status_code, latency):
+        return None
+    page_cache.put(url, response.text)
+    return response.text
+
+
+# Text of a server-rendered search page that simply has no matches. The search form is no
+# use as a marker: the unrendered shell page has it too
+EMPTY_SEARCH_MARKER = 'No results found'
+
+
+def has_listing_markup(page_source):
+    # Search results on classificationoffice.govt.nz are rendered as div[data-listing]
+    return bool(page_source) and 'data-listing' in page_source
+
+
+def is_search_page(page_source):
+    # True for a complete search page: listings, or the explicit "No results found" page.
+    # A failed fetch or any other page, such as the shell, is rendered in Chrome
+    if has_listing_markup(page_source):
+        return True
+    return bool(page_source) and EMPTY_SEARCH_MARKER in page_source
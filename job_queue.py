@@ -0,0 +1,354 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import job_storage
+import metrics
+import stage_timing
+from page_cache import page_cache
+
+# SQLite file shared by every app process that serves uploads
+JOBS_DB_PATH = 'jobs.sqlite3'
+# Background threads per process that pick up queued jobs
+WORKER_COUNT = 1
+POLL_INTERVAL = 1.0
+# How often workers delete files of jobs past job_storage.RETENTION_SECONDS
+CLEANUP_INTERVAL = 3600
+# Finished rows are written to the checkpoint table in batches of this many rows,
+# or after this many seconds, whichever comes first
+CHECKPOINT_ROWS = 20
+CHECKPOINT_INTERVAL = 10.0
+# A running job with no progress for this long is assumed dead (Chrome or host crash) and requeued
+STALE_JOB_SECONDS = 600
+STALE_CHECK_INTERVAL = 60
+
+# Default for progress(rows_total=...), so a None total isn't counted as a finished row
+UNKNOWN = object()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    input_path TEXT NOT NULL,
+    output_path TEXT,
+    rows_total INTEGER,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    rows_failed INTEGER NOT NULL DEFAULT 0,
+    rows_deduplicated INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    heartbeat_at REAL
+)
+'''
+
+# Columns added after the first release, for job databases created before them
+MIGRATIONS = (
+    ('cursor', 'INTEGER NOT NULL DEFAULT 0'),
+    ('heartbeat_at', 'REAL'),
+    ('rows_deduplicated', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+ROWS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS job_rows (
+    job_id TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, row_index)
+)
+'''
+
+
+class Checkpoint:
+    # Finished row results of one job; rows found here are re-emitted instead of scraped again
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.completed = queue.completed_rows(job_id)
+        self.cursor = 0
+        self._pending = []
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def save(self, row_index, ok, result):
+        # Called in row order, so every row before row_index is already saved or pending
+        with self._lock:
+            if row_index not in self.completed:
+                self._pending.append((self.job_id, row_index, int(ok), json.dumps(result)))
+            self.cursor = row_index + 1
+            if len(self._pending) >= CHECKPOINT_ROWS or time.monotonic() - self._flushed_at >= CHECKPOINT_INTERVAL:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self.queue.save_rows(self.job_id, self._pending, self.cursor)
+        self._pending = []
+        self._flushed_at = time.monotonic()
+
+class JobQueue:
+    def __init__(self, db_path=JOBS_DB_PATH):
+        self.db_path = db_path
+        self.handlers = {}
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.execute(SCHEMA)
+            conn.execute(ROWS_SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for name, definition in MIGRATIONS:
+                if name not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {definition}')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def register(self, kind, handler):
+        # handler(job, progress, checkpoint) processes job['input_path'] and returns the output path
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, file):
+        # Each job gets its own directory, so concurrent uploads never share file names
+        job_id = job_storage.new_job_id()
+        input_path = job_storage.output_path(job_id, 'upload.xlsx')
+        file.save(input_path)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, status, input_path, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, kind, 'queued', input_path, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, kinds):
+        placeholders = ', '.join('?' for _ in kinds)
+        conn = self._connect()
+        try:
+            # IMMEDIATE takes the write lock up front so two workers can't claim the same job
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+                "ORDER BY created_at LIMIT 1",
+                list(kinds),
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (now, now, row['id']),
+            )
+            conn.execute('COMMIT')
+            return dict(row, status='running')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def update(self, job_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', list(fields.values()) + [job_id])
+
+    def completed_rows(self, job_id):
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT row_index, ok, result FROM job_rows WHERE job_id = ?', (job_id,)).fetchall()
+        return {row['row_index']: (bool(row['ok']), json.loads(row['result'])) for row in rows}
+
+    def save_rows(self, job_id, rows, cursor):
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                'INSERT OR REPLACE INTO job_rows (job_id, row_index, ok, result) VALUES (?, ?, ?, ?)', rows)
+            conn.execute('UPDATE jobs SET cursor = ? WHERE id = ?', (cursor, job_id))
+            conn.execute('COMMIT')
+
+    def retry_failed(self, job_id):
+        # Drops only the rows that errored from the checkpoint and queues the job again;
+        # every other row is re-emitted from the checkpoint without being scraped
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            job = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if job is None or job['status'] not in ('done', 'failed'):
+                conn.execute('ROLLBACK')
+                return False
+            first_failed = conn.execute(
+                'SELECT MIN(row_index) FROM job_rows WHERE job_id = ? AND ok = 0', (job_id,)).fetchone()[0]
+            retried = conn.execute('DELETE FROM job_rows WHERE job_id = ? AND ok = 0', (job_id,)).rowcount
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = NULL, finished_at = NULL, "
+                "cursor = MIN(cursor, COALESCE(?, cursor)) WHERE id = ?",
+                (first_failed, job_id),
+            )
+            conn.execute('COMMIT')
+        metrics.increment('scraper_row_retries_total', retried)
+        return True
+
+    def requeue_stale(self, stale=STALE_JOB_SECONDS):
+        # Jobs whose worker died mid-run go back on the queue and resume from their checkpoint
+        cutoff = time.time() - stale
+        with closing(self._connect()) as conn:
+            requeued = conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' "
+                "AND COALESCE(heartbeat_at, started_at) < ?",
+                (cutoff,),
+            ).rowcount
+        if requeued:
+            metrics.increment('scraper_job_resumes_total', requeued)
+            logging.info(f"Requeued {requeued} interrupted jobs")
+        return requeued
+
+    def counts(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def status(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        eta_seconds = None
+        processed = job['rows_done'] + job['rows_failed']
+        if job['status'] == 'running' and job['started_at'] and processed and job['rows_total']:
+            elapsed = time.time() - job['started_at']
+            remaining = max(job['rows_total'] - processed, 0)
+            eta_seconds = round(elapsed / processed * remaining, 1)
+
+        return {
+            'job_id': job['id'],
+            'kind': job['kind'],
+            'status': job['status'],
+            'rows_total': job['rows_total'],
+            'rows_done': job['rows_done'],
+            'rows_failed': job['rows_failed'],
+            'rows_checkpointed': job['cursor'],
+            # Rows answered from an identical earlier row instead of being scraped again
+            'fetches_saved': job['rows_deduplicated'],
+            'eta_seconds': eta_seconds,
+            'error': job['error'],
+            'output_path': job['output_path'],
+        }
+
+    def _run(self, job):
+        handler = self.handlers[job['kind']]
+        checkpoint = Checkpoint(self, job['id'])
+        counts = {'done': 0, 'failed': 0, 'deduplicated': 0}
+        for ok, _ in checkpoint.completed.values():
+            counts['done' if ok else 'failed'] += 1
+        if checkpoint.completed:
+            logging.info(f"Resuming job {job['id']} with {len(checkpoint.completed)} rows already done")
+        self.update(job['id'], rows_done=counts['done'], rows_failed=counts['failed'], rows_deduplicated=0)
+        lock = threading.Lock()
+
+        def progress(ok=True, rows_total=UNKNOWN, deduplicated=False):
+            with lock:
+                if rows_total is not UNKNOWN:
+                    # The total may itself be None when the sheet doesn't record its size
+                    self.update(job['id'], rows_total=rows_total)
+                    return
+                counts['done' if ok else 'failed'] += 1
+                if deduplicated:
+                    counts['deduplicated'] += 1
+                self.update(job['id'], rows_done=counts['done'], rows_failed=counts['failed'],
+                            rows_deduplicated=counts['deduplicated'], heartbeat_at=time.time())
+
+        timings_before = stage_timing.mark()
+        try:
+            output_path = handler(job, progress, checkpoint)
+            if counts['deduplicated']:
+                logging.info(f"Job {job['id']} saved {counts['deduplicated']} fetches on duplicate rows")
+            self.update(job['id'], status='done', output_path=output_path, finished_at=time.time())
+        except Exception as e:
+            logging.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            self.update(job['id'], status='failed', error=str(e), finished_at=time.time())
+        self._write_timings(job['id'], timings_before)
+
+    def _write_timings(self, job_id, timings_before):
+        # Per-stage summary beside the output. Timers are process-wide, so with more than
+        # one worker the summary also includes stages of jobs that ran at the same time
+        job = self.get(job_id)
+        if not job['output_path']:
+            return
+        try:
+            stage_timing.write_summary(
+                stage_timing.timings_path_for(job['output_path']), stage_timing.summary_since(timings_before),
+                job_id=job_id, kind=job['kind'], status=job['status'], rows_done=job['rows_done'],
+                rows_failed=job['rows_failed'], elapsed_seconds=round(job['finished_at'] - job['started_at'], 3),
+            )
+        except OSError as e:
+            logging.error(f"Could not write timings for job {job_id}: {e}")
+
+    def cleanup_expired(self, retention=job_storage.RETENTION_SECONDS):
+        cutoff = time.time() - retention
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+            ).fetchall()
+        for row in rows:
+            job_storage.remove_job_files(row['id'])
+            self.update(row['id'], status='expired', output_path=None)
+            with closing(self._connect()) as conn:
+                conn.execute('DELETE FROM job_rows WHERE job_id = ?', (row['id'],))
+        if rows:
+            logging.info(f"Removed files of {len(rows)} expired jobs")
+
+    def _worker_loop(self):
+        next_cleanup = next_stale_check = 0
+        while True:
+            if time.time() >= next_stale_check:
+                try:
+                    self.requeue_stale()
+                except sqlite3.Error as e:
+                    logging.error(f"Could not requeue interrupted jobs: {e}")
+                next_stale_check = time.time() + STALE_CHECK_INTERVAL
+            if time.time() >= next_cleanup:
+                try:
+                    self.cleanup_expired()
+                except Exception as e:
+                    logging.error(f"Job cleanup failed: {e}")
+                try:
+                    page_cache.prune()
+                except Exception as e:
+                    logging.error(f"Page cache cleanup failed: {e}")
+                next_cleanup = time.time() + CLEANUP_INTERVAL
+            try:
+                job = self.claim(list(self.handlers))
+            except sqlite3.Error as e:
+                logging.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                time.sleep(POLL_INTERVAL)
+                continue
+            self._run(job)
+
+    def start_workers(self, count=WORKER_COUNT):
+        # Safe to call more than once; only the first call starts anything
+        with self._workers_lock:
+            if self._workers:
+                return
+            for i in range(count):
+                worker = threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+
+job_queue = JobQueue()
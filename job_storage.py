@@ -0,0 +1,74 @@
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+# Uploads and results live in one directory per job
+JOB_FILES_DIR = 'job_files'
+# Finished job files are deleted after this long
+RETENTION_SECONDS = 7 * 24 * 3600
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def is_job_id(value):
+    # Job ids end up in file paths, so only accept what new_job_id() produces
+    return bool(JOB_ID_PATTERN.match(value or ''))
+
+
+def job_dir(job_id):
+    if not is_job_id(job_id):
+        raise ValueError(f"Invalid job id: {job_id!r}")
+    path = os.path.join(JOB_FILES_DIR, job_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def output_path(job_id, filename):
+    return os.path.join(job_dir(job_id), os.path.basename(filename))
+
+
+def working_path(final_path):
+    # Results are written under a temporary name and renamed into place when complete,
+    # so a download never sees a half-written file under the final name
+    root, extension = os.path.splitext(final_path)
+    return f'{root}.inprogress{extension}'
+
+
+def publish(final_path):
+    os.replace(working_path(final_path), final_path)
+    return final_path
+
+
+def find_output(job_id, filename):
+    if not is_job_id(job_id):
+        return None
+    path = os.path.join(JOB_FILES_DIR, job_id, os.path.basename(filename))
+    return path if os.path.exists(path) else None
+
+
+def remove_job_files(job_id):
+    if is_job_id(job_id):
+        shutil.rmtree(os.path.join(JOB_FILES_DIR, job_id), ignore_errors=True)
+
+
+def cleanup_untracked(retention=RETENTION_SECONDS):
+    # Job directories written outside the job queue (e.g. app3's synchronous uploads)
+    if not os.path.isdir(JOB_FILES_DIR):
+        return 0
+    cutoff = time.time() - retention
+    removed = 0
+    for name in os.listdir(JOB_FILES_DIR):
+        path = os.path.join(JOB_FILES_DIR, name)
+        if is_job_id(name) and os.path.getmtime(path) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    if removed:
+        logging.info(f"Removed {removed} expired output directories")
+    return removed
@@ -0,0 +1,52 @@
+import bisect
+import threading
+
+# Upper bounds (seconds) of the latency buckets; the last bucket is open-ended
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def bucket_percentile(buckets, counts, pct):
+    # Upper bound of the bucket holding the requested percentile
+    total = sum(counts)
+    if not total:
+        return None
+    target = total * pct / 100.0
+    seen = 0
+    for index, bucket_count in enumerate(counts):
+        seen += bucket_count
+        if seen >= target:
+            return buckets[index] if index < len(buckets) else float('inf')
+    return float('inf')
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+
+    def percentile(self, pct):
+        with self._lock:
+            counts = list(self.counts)
+        return bucket_percentile(self.buckets, counts, pct)
+
+    def state(self):
+        with self._lock:
+            return list(self.counts), self.count, self.total
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'sum': round(self.total, 6),
+                'buckets': {str(bound): count for bound, count in zip(self.buckets + ('inf',), self.counts)},
+            }
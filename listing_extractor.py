@@ -0,0 +1,100 @@
+import os
+from collections import namedtuple
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.element import Tag
+
+from stage_timing import timed
+
+# lxml is several times faster than html.parser; fall back when it isn't installed
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# Overridable so the offline benchmark can point the scrapers at a local fixture server
+CLASSIFICATION_OFFICE_URL = os.environ.get('CLASSIFICATION_OFFICE_URL', "https://www.classificationoffice.govt.nz/")
+SEARCH_URL = CLASSIFICATION_OFFICE_URL + "find-a-rating/?search="
+
+Listing = namedtuple('Listing', [
+    'title',
+    'director_text',
+    'classification',
+    'mr_text',
+    'run_time',
+    'label_issued_by',
+    'label_issued_on',
+])
+
+# Only the div[data-listing] subtrees are built; page chrome, scripts and footers are skipped
+LISTING_STRAINER = SoupStrainer('div', attrs={'data-listing': ''})
+
+TABLE_LABELS = (
+    ('Running time:', 'run_time'),
+    ('Label issued by:', 'label_issued_by'),
+    ('Label issued on:', 'label_issued_on'),
+)
+
+
+def parse_table(table):
+    fields = {'run_time': 'N/A', 'label_issued_by': 'N/A', 'label_issued_on': 'N/A'}
+    pending = None
+    for text in table.stripped_strings:
+        if pending:
+            # The value is the string straight after its label
+            fields[pending] = text
+            pending = None
+        for label, field in TABLE_LABELS:
+            if label in text:
+                pending = field
+                break
+    return fields
+
+
+def extract_listing(listing):
+    title_tag = director_tag = classification_tag = mr_tag = table = None
+
+    # One walk over the subtree, keeping the first match for each field just like find()
+    for node in listing.descendants:
+        if not isinstance(node, Tag):
+            continue
+        classes = node.get('class') or ()
+        if node.name == 'p':
+            if director_tag is None and 'small' in classes:
+                director_tag = node
+            if 'large' in classes:
+                if mr_tag is None:
+                    mr_tag = node
+                if classification_tag is None and ' '.join(classes) == 'large mb-2':
+                    classification_tag = node
+        elif node.name == 'h3':
+            if title_tag is None and 'h2' in classes:
+                title_tag = node
+        elif node.name == 'table':
+            if table is None and 'rating-result-table' in classes:
+                table = node
+
+    fields = parse_table(table) if table is not None else {
+        'run_time': 'N/A', 'label_issued_by': 'N/A', 'label_issued_on': 'N/A'}
+
+    return Listing(
+        title=title_tag.get_text(strip=True) if title_tag else None,
+        director_text=director_tag.get_text(strip=True) if director_tag else None,
+        classification=classification_tag.get_text(strip=True) if classification_tag else 'N/A',
+        mr_text=mr_tag.get_text(strip=True) if mr_tag else 'N/A',
+        **fields
+    )
+
+
+@timed('parse.listings')
+def extract_listings(page_source):
+    if not page_source:
+        return []
+    soup = BeautifulSoup(page_source, PARSER, parse_only=LISTING_STRAINER)
+    return [extract_listing(listing) for listing in soup.find_all('div', {'data-listing': ''})]
+
+
+def release_year_from(text):
+    parts = text.split(',')
+    return parts[0].strip() if len(parts) > 1 else 'N/A'
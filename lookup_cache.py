@@ -0,0 +1,201 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from blocking_io import cache_io
+from page_cache import replay_enabled
+
+LOOKUP_CACHE_PATH = 'lookup_cache.sqlite3'
+# How long a found title is trusted before it is scraped again
+CACHE_TTL = 30 * 24 * 3600
+# "Not found" answers expire sooner so newly rated titles get picked up
+NEGATIVE_CACHE_TTL = 2 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS lookups (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    found INTEGER NOT NULL,
+    details TEXT,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+'''
+
+# Stands in for the result of a lookup that raised, which is never cached
+_FAILED = object()
+
+# Errors seen by the lookup currently running. A context variable rather than a thread-local,
+# so lookups running as asyncio tasks on the same thread each get their own
+_lookup_state = contextvars.ContextVar('lookup_state', default=None)
+# Errors seen by every lookup of the row currently running, so the row can be reported as
+# failed rather than "not found" when a site was down
+_row_state = contextvars.ContextVar('row_state', default=None)
+
+
+def normalize(value):
+    # Case and whitespace differences between sheets shouldn't cause a cache miss
+    return ' '.join(str(value).split()).casefold()
+
+
+def lookup_key(args):
+    return '\x1f'.join(normalize(arg) for arg in args)
+
+
+def is_not_found(details):
+    return details is None or details.get('classification', 'N/A') == 'N/A'
+
+
+def mark_failed(error=None):
+    # Called from a lookup's error handler, and by the fetchers when a site errors, so an
+    # outage isn't cached as "not found". error is an exception or a short reason string
+    if error is None:
+        error = 'LookupFailed'
+    name = error if isinstance(error, str) else type(error).__name__
+    for errors in (_lookup_state.get(), _row_state.get()):
+        if errors is not None:
+            errors.append(name)
+
+
+@contextlib.contextmanager
+def recording_failures():
+    # Collects the mark_failed errors of every lookup run inside the block
+    errors = []
+    token = _row_state.set(errors)
+    try:
+        yield errors
+    finally:
+        _row_state.reset(token)
+
+
+class LookupCache:
+    def __init__(self, path=LOOKUP_CACHE_PATH, ttl=CACHE_TTL, negative_ttl=NEGATIVE_CACHE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'stores': 0}
+        # (namespace, 'cached' or 'fetched') and (namespace, exception name) counts for /metrics
+        self.lookups = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(SCHEMA)
+
+    def get(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT found, details, stored_at FROM lookups WHERE namespace = ? AND key = ?',
+                (namespace, key),
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return False, None
+
+            found, details, stored_at = row
+            ttl = self.ttl if found else self.negative_ttl
+            if time.time() - stored_at > ttl:
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return False, None
+
+            self.stats['hits' if found else 'negative_hits'] += 1
+        return True, json.loads(details) if details else None
+
+    def put(self, namespace, key, details):
+        found = 0 if is_not_found(details) else 1
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO lookups (namespace, key, found, details, stored_at) VALUES (?, ?, ?, ?, ?)',
+                (namespace, key, found, json.dumps(details) if details is not None else None, time.time()),
+            )
+            self.stats['stores'] += 1
+
+    def _cached(self, namespace, key, args, identity):
+        hit, details = self.get(namespace, key)
+        if hit:
+            with self._lock:
+                self.lookups[(namespace, 'cached')] += 1
+            if identity is not None and isinstance(details, dict):
+                # The entry may come from another sheet that typed the same title differently;
+                # the row shows this lookup's own input
+                details.update((field, value) for field, value in identity(*args).items() if field in details)
+        return hit, details
+
+    def _finished(self, namespace, key, args, details, errors):
+        with self._lock:
+            self.lookups[(namespace, 'fetched')] += 1
+            for error in errors:
+                self.errors[(namespace, error)] += 1
+        if details is not _FAILED:
+            if errors:
+                logging.debug(f"Not caching {namespace} lookup for {args}: the lookup errored")
+            else:
+                self.put(namespace, key, details)
+
+    def cached(self, namespace, identity=None):
+        # identity(*args) returns the result fields that echo the lookup's input; they are
+        # refreshed from the current arguments on a cache hit
+        def decorator(lookup):
+            @functools.wraps(lookup)
+            def wrapper(*args, **kwargs):
+                if replay_enabled():
+                    # Replays exist to re-run extraction, so never short-circuit it
+                    return lookup(*args, **kwargs)
+                key = lookup_key(args)
+                hit, details = self._cached(namespace, key, args, identity)
+                if hit:
+                    return details
+
+                errors = []
+                token = _lookup_state.set(errors)
+                details = _FAILED
+                try:
+                    details = lookup(*args, **kwargs)
+                finally:
+                    _lookup_state.reset(token)
+                    self._finished(namespace, key, args, details, errors)
+                return details
+            return wrapper
+        return decorator
+
+    def cached_async(self, namespace, identity=None):
+        # Same as cached() for coroutine lookups. The SQLite reads and writes run on the cache I/O
+        # threads so they never hold up the event loop
+        def decorator(lookup):
+            @functools.wraps(lookup)
+            async def wrapper(*args, **kwargs):
+                if replay_enabled():
+                    return await lookup(*args, **kwargs)
+                key = lookup_key(args)
+                hit, details = await cache_io(self._cached, namespace, key, args, identity)
+                if hit:
+                    return details
+
+                errors = []
+                token = _lookup_state.set(errors)
+                details = _FAILED
+                try:
+                    details = await lookup(*args, **kwargs)
+                finally:
+                    _lookup_state.reset(token)
+                    await cache_io(self._finished, namespace, key, args, details, errors)
+                return details
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def lookup_counts(self):
+        with self._lock:
+            return dict(self.lookups), dict(self.errors)
+
+
+lookup_cache = LookupCache()
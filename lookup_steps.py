@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from async_fetch import fetch_page_async, render_async
+from http_fetch import fetch_page
+
+# A lookup is written once, as a generator that yields the I/O it needs as steps and is sent
+# each step's result back. run_steps performs the steps with blocking calls on the calling
+# thread and run_steps_async awaits them on the event loop, so the thread and async engines
+# share one copy of every lookup's decisions and parsing.
+# An exception raised by a step is thrown into the generator at the yield that asked for it
+
+
+def fetch(url):
+    return ('fetch', url)
+
+
+def render(browser_pool, url, ready):
+    return ('render', browser_pool, url, ready)
+
+
+def sleep(seconds):
+    return ('sleep', seconds)
+
+
+def call(function, *args):
+    # function blocks under run_steps and is a coroutine function under run_steps_async,
+    # e.g. SeasonPlanner.listings and AsyncSeasonPlanner.listings
+    return ('call', function, args)
+
+
+def fetch_or_render(url, browser_pool, ready, complete):
+    # A plain GET is usually enough; only a page that complete() rejects is rendered in Chrome
+    page_source = yield fetch(url)
+    if not complete(page_source) and browser_pool is not None:
+        page_source = yield render(browser_pool, url, ready)
+    return page_source
+
+
+def _perform(step):
+    kind, *args = step
+    if kind == 'fetch':
+        return fetch_page(*args)
+    if kind == 'render':
+        browser_pool, url, ready = args
+        return browser_pool.render(url, ready)
+    if kind == 'sleep':
+        return time.sleep(*args)
+    function, call_args = args
+    return function(*call_args)
+
+
+async def _perform_async(step):
+    kind, *args = step
+    if kind == 'fetch':
+        return await fetch_page_async(*args)
+    if kind == 'render':
+        return await render_async(*args)
+    if kind == 'sleep':
+        return await asyncio.sleep(*args)
+    function, call_args = args
+    return await function(*call_args)
+
+
+def run_steps(steps):
+    value = error = None
+    while True:
+        try:
+            step = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        value = error = None
+        try:
+            value = _perform(step)
+        except Exception as e:
+            error = e
+
+
+async def run_steps_async(steps):
+    value = error = None
+    while True:
+        try:
+            step = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        value = error = None
+        try:
+            value = await _perform_async(step)
+        except Exception as e:
+            error = e
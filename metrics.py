@@ -0,0 +1,107 @@
+import threading
+from collections import defaultdict
+
+from rate_limiter import rate_limiter
+from readiness import readiness_stats
+from stage_timing import stage_latency
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Counters incremented from the hot paths, with their help text
+COUNTERS = {
+    'scraper_rows_total': 'Rows finished, by outcome',
+    'scraper_row_errors_total': 'Rows whose lookup raised, by exception type',
+    'scraper_requests_total': 'Page requests sent, by site, transport and outcome',
+    'scraper_browser_launches_total': 'Chrome instances started',
+    'scraper_browser_discards_total': 'Chrome instances quit, by reason',
+    'scraper_browser_tabs_opened_total': 'Tabs opened in the shared Chrome (SCRAPER_BROWSER_TABS)',
+    'scraper_browser_tabs_closed_total': 'Tabs of the shared Chrome closed, by reason',
+    'scraper_row_retries_total': 'Failed rows queued again through /jobs/<job_id>/retry',
+    'scraper_job_resumes_total': 'Interrupted jobs requeued to resume from their checkpoint',
+}
+
+_counters = defaultdict(float)
+_lock = threading.Lock()
+
+
+def increment(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += amount
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _histogram(lines, name, histogram, labels):
+    counts, count, total = histogram.state()
+    cumulative = 0
+    for bound, bucket_count in zip(histogram.buckets + ('+Inf',), counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+    lines.append(f'{name}_sum{_labels(labels)} {total}')
+    lines.append(f'{name}_count{_labels(labels)} {count}')
+
+
+def render(job_queue=None, browser_pool=None, lookup_cache=None):
+    # Prometheus text exposition format
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+    for name, help_text in COUNTERS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'{name}{_labels(labels)} {value}')
+
+    if lookup_cache is not None:
+        lookups, errors = lookup_cache.lookup_counts()
+        lines.append('# HELP scraper_lookups_total Site lookups, by site and whether the result cache answered')
+        lines.append('# TYPE scraper_lookups_total counter')
+        for (namespace, source), value in sorted(lookups.items()):
+            lines.append(f'scraper_lookups_total{_labels((("site", namespace), ("source", source)))} {value}')
+        lines.append('# HELP scraper_lookup_errors_total Failed lookup attempts, by site and exception type')
+        lines.append('# TYPE scraper_lookup_errors_total counter')
+        for (namespace, error), value in sorted(errors.items()):
+            lines.append(f'scraper_lookup_errors_total{_labels((("site", namespace), ("error", error)))} {value}')
+        lines.append('# HELP scraper_lookup_cache_events_total Result cache reads and writes, by event')
+        lines.append('# TYPE scraper_lookup_cache_events_total counter')
+        for event, value in sorted(lookup_cache.snapshot().items()):
+            lines.append(f'scraper_lookup_cache_events_total{_labels((("event", event),))} {value}')
+
+    if job_queue is not None:
+        lines.append('# HELP scraper_jobs Jobs in the queue database, by status')
+        lines.append('# TYPE scraper_jobs gauge')
+        for status, count in sorted(job_queue.counts().items()):
+            lines.append(f'scraper_jobs{_labels((("status", status),))} {count}')
+
+    if browser_pool is not None:
+        stats = browser_pool.stats()
+        lines.append('# HELP scraper_browsers Pooled Chrome instances, or tabs of the shared Chrome, by state')
+        lines.append('# TYPE scraper_browsers gauge')
+        for state in ('idle', 'in_use'):
+            lines.append(f'scraper_browsers{_labels((("state", state),))} {stats[state]}')
+
+    lines.append('# HELP scraper_rate_limit_requests_per_second Current request rate allowed per site')
+    lines.append('# TYPE scraper_rate_limit_requests_per_second gauge')
+    for site, rate in sorted(rate_limiter.rates().items()):
+        lines.append(f'scraper_rate_limit_requests_per_second{_labels((("site", site),))} {rate}')
+
+    lines.append('# HELP scraper_stage_seconds Time spent in each stage of a lookup')
+    lines.append('# TYPE scraper_stage_seconds histogram')
+    for stage, histogram in sorted(stage_latency.items()):
+        _histogram(lines, 'scraper_stage_seconds', histogram, (('stage', stage),))
+
+    lines.append('# HELP scraper_browser_wait_timeouts_total Readiness waits that hit their timeout')
+    lines.append('# TYPE scraper_browser_wait_timeouts_total counter')
+    for condition, stats in sorted(readiness_stats().items()):
+        lines.append(f'scraper_browser_wait_timeouts_total{_labels((("condition", condition),))} '
+                     f'{stats["timeouts"]}')
+
+    return '\n'.join(lines) + '\n'
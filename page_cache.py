@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+PAGE_CACHE_DIR = 'page_cache'
+# SCRAPER_REPLAY=1 serves every page from the cache and never touches the network,
+# so an upload can be re-extracted offline after parsing or matching rules change
+REPLAY = os.environ.get('SCRAPER_REPLAY') == '1'
+# Recorded pages are kept this long, which covers re-extracting any upload still on disk
+PAGE_CACHE_TTL = 14 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    request_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    form TEXT,
+    content_hash TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+)
+'''
+
+
+def replay_enabled():
+    return REPLAY
+
+
+def request_key(url, form=None):
+    payload = json.dumps([url, sorted((form or {}).items())])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    def __init__(self, root=PAGE_CACHE_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, 'index.sqlite3'), timeout=30,
+                                     check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(SCHEMA)
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blob_dir, content_hash[:2], content_hash + '.html.z')
+
+    def put(self, url, page_source, form=None):
+        if not page_source:
+            return
+        data = page_source.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(content_hash)
+        try:
+            # Identical pages (e.g. repeated empty results) share one blob; touching it
+            # keeps prune() from removing it
+            os.utime(path)
+        except OSError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (request_key, url, form, content_hash, fetched_at) VALUES (?, ?, ?, ?, ?)',
+                (request_key(url, form), url, json.dumps(form) if form else None, content_hash, time.time()),
+            )
+
+    def get(self, url, form=None):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT content_hash FROM pages WHERE request_key = ?', (request_key(url, form),)
+            ).fetchone()
+        if row is None:
+            if REPLAY:
+                logging.debug(f"Replay cache miss for {url} {form or ''}")
+            return None
+        try:
+            with open(self._blob_path(row[0]), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except OSError as e:
+            logging.error(f"Page cache blob missing for {url}: {e}")
+            return None
+
+    def prune(self, ttl=PAGE_CACHE_TTL):
+        # Drops pages fetched more than ttl ago, then the blobs no remaining page points at
+        cutoff = time.time() - ttl
+        with self._lock:
+            removed = self._conn.execute('DELETE FROM pages WHERE fetched_at < ?', (cutoff,)).rowcount
+            in_use = {row[0] for row in self._conn.execute('SELECT DISTINCT content_hash FROM pages')}
+        blobs = 0
+        for directory, _, names in os.walk(self.blob_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.split('.', 1)[0] in in_use:
+                    continue
+                try:
+                    # A blob written since the cutoff may belong to a page being stored right now
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        blobs += 1
+                except OSError:
+                    continue
+        if removed or blobs:
+            logging.info(f"Page cache dropped {removed} pages and {blobs} blobs older than {ttl // 86400} days")
+
+    def entries(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT url, form, content_hash FROM pages').fetchall()
+        return [(url, json.loads(form) if form else None, content_hash) for url, form, content_hash in rows]
+
+
+page_cache = PageCache()
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+
+from site_limits import site_of
+
+# Steady request rate (per second), burst size and whether to back off on trouble, per host
+RATE_LIMITS = {
+    'www.classificationoffice.govt.nz': {'rate': 2.0, 'burst': 4, 'adaptive': True},
+    'www.fvlb.org.nz': {'rate': 1.0, 'burst': 3, 'adaptive': True},
+}
+DEFAULT_RATE_LIMIT = {'rate': 1.0, 'burst': 2, 'adaptive': True}
+
+# Adaptive mode: responses slower than this count as a sign the site is struggling
+SLOW_RESPONSE_SECONDS = 5.0
+# Never back off below this fraction of the configured rate
+MIN_RATE_FACTOR = 0.1
+# Fraction of the configured rate regained after each healthy response
+RECOVERY_STEP = 0.05
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, adaptive=False):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.adaptive = adaptive
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self):
+        # Takes a token now and returns how long the caller must wait before using it
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def record(self, ok, latency):
+        if not self.adaptive:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            if not ok or latency > SLOW_RESPONSE_SECONDS:
+                # Multiplicative decrease, additive increase
+                self.rate = max(self.rate * 0.5, self.base_rate * MIN_RATE_FACTOR)
+                logging.debug(f"Rate limiter backing off to {self.rate:.2f} req/s")
+            else:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * RECOVERY_STEP)
+
+
+class RateLimiter:
+    def __init__(self, limits=RATE_LIMITS, default=DEFAULT_RATE_LIMIT):
+        self.limits = limits
+        self.default = default
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        host = site_of(url)
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(**self.limits.get(host, self.default))
+            return self._buckets[host]
+
+    def acquire(self, url):
+        return self.bucket(url).acquire()
+
+    def reserve(self, url):
+        return self.bucket(url).reserve()
+
+    def record(self, url, ok, latency):
+        self.bucket(url).record(ok, latency)
+
+    def rates(self):
+        # Current (possibly backed-off) rate per host
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+
+
+# Shared by every worker thread in the process
+rate_limiter = RateLimiter()
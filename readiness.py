@@ -0,0 +1,88 @@
+import logging
+import time
+from collections import defaultdict
+
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from latency import Histogram
+
+POLL_INTERVAL = 0.1
+
+# What "ready" means for each page we scrape
+CONDITIONS = {
+    'listings': EC.presence_of_element_located((By.CSS_SELECTOR, 'div[data-listing]')),
+    'fvlb_form': EC.presence_of_element_located((By.CSS_SELECTOR, '#fvlb-input')),
+    'result_title': EC.presence_of_element_located((By.CSS_SELECTOR, '.result-title')),
+    'detail_h1': EC.presence_of_element_located((By.CSS_SELECTOR, 'h1')),
+    'document_ready': lambda driver: driver.execute_script('return document.readyState') == 'complete',
+}
+
+# Per-condition timeouts in seconds. 'listings' is capped at the old fixed sleep
+# because an empty search result never produces a listing node.
+TIMEOUTS = {
+    'listings': 5,
+    'fvlb_form': 10,
+    'result_title': 10,
+    'detail_h1': 10,
+    'document_ready': 15,
+}
+
+wait_latency = defaultdict(Histogram)
+wait_timeouts = defaultdict(int)
+
+
+def wait_until_ready(driver, condition, timeout=None, stale=None):
+    timeout = TIMEOUTS[condition] if timeout is None else timeout
+    wait = WebDriverWait(driver, timeout, poll_frequency=POLL_INTERVAL)
+    start_time = time.time()
+    try:
+        if stale is not None:
+            # Wait for the previous page to go away before checking the new one
+            wait.until(EC.staleness_of(stale))
+        wait.until(CONDITIONS[condition])
+        ready = True
+    except TimeoutException:
+        wait_timeouts[condition] += 1
+        logging.debug(f"Timed out after {timeout}s waiting for {condition}")
+        ready = False
+    wait_latency[condition].observe(time.time() - start_time)
+    return ready
+
+
+def _check(tab, condition):
+    try:
+        return bool(tab.run(condition))
+    except (NoSuchElementException, StaleElementReferenceException):
+        return False
+
+
+def wait_until_tab_ready(tab, condition, timeout=None, stale=None):
+    # wait_until_ready for a tab sharing its driver with other tabs: the driver is only
+    # held for each check, so the other tabs can be polled in between
+    timeout = TIMEOUTS[condition] if timeout is None else timeout
+    start_time = time.time()
+    deadline = start_time + timeout
+    ready = False
+    while True:
+        if stale is None or _check(tab, EC.staleness_of(stale)):
+            stale = None
+            if _check(tab, CONDITIONS[condition]):
+                ready = True
+                break
+        if time.time() >= deadline:
+            wait_timeouts[condition] += 1
+            logging.debug(f"Timed out after {timeout}s waiting for {condition} in a tab")
+            break
+        time.sleep(POLL_INTERVAL)
+    wait_latency[condition].observe(time.time() - start_time)
+    return ready
+
+
+def readiness_stats():
+    return {
+        condition: dict(histogram.snapshot(), timeouts=wait_timeouts[condition])
+        for condition, histogram in wait_latency.items()
+    }
@@ -0,0 +1,35 @@
+import importlib
+import logging
+import os
+import sys
+import time
+
+# Must be set before the scraper modules (and page_cache) are imported
+os.environ['SCRAPER_REPLAY'] = '1'
+
+APPS = {
+    'movie': ('version1moviesfinal', 'run_movie_job'),
+    'series': ('v1seasonNo', 'run_series_job'),
+}
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in APPS:
+        print(f"Usage: python replay.py {{{'|'.join(APPS)}}} <upload.xlsx>")
+        return 1
+
+    module_name, handler_name = APPS[sys.argv[1]]
+    handler = getattr(importlib.import_module(module_name), handler_name)
+    import job_storage
+
+    def progress(ok=True, rows_total=None, deduplicated=False):
+        pass
+
+    start_time = time.time()
+    output_path = handler({'id': job_storage.new_job_id(), 'input_path': sys.argv[2]}, progress)
+    logging.info(f"Replayed {sys.argv[2]} into {output_path} in {time.time() - start_time:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import sys
+
+import pandas as pd
+
+# Shared "nothing found" value; every 'N/A' cell points at this one string object
+NA = sys.intern('N/A')
+
+
+class ResultColumns:
+    # Collects result rows column by column instead of keeping a dict per row, so a large
+    # job holds one list per column and to_frame() needs no per-row dict-to-column pass
+    __slots__ = ('columns', '_data', '_rows')
+
+    def __init__(self, columns=()):
+        self.columns = []
+        self._data = {}
+        self._rows = 0
+        for column in columns:
+            self._add_column(column)
+
+    def _add_column(self, column):
+        # A key first seen part way through is padded for the earlier rows, like DataFrame(rows) does
+        self.columns.append(column)
+        self._data[column] = [None] * self._rows
+
+    def append(self, row):
+        for column in row:
+            if column not in self._data:
+                self._add_column(column)
+        for column in self.columns:
+            value = row.get(column)
+            self._data[column].append(NA if value == NA else value)
+        self._rows += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self._rows
+
+    def to_frame(self):
+        return pd.DataFrame(self._data, columns=self.columns)
@@ -0,0 +1,29 @@
+import pandas as pd
+
+
+def normalize_titles(titles):
+    # Vectorised version of lookup_cache.normalize: collapse whitespace and case-fold
+    return titles.astype(str).str.split().str.join(' ').str.casefold()
+
+
+def merge_second_pass(results_df, additional_results):
+    # Fill rows the first scraper missed with nz_title_check() output, joined on the
+    # normalized title in one hash join instead of a per-row scan
+    if not additional_results:
+        return results_df
+
+    extra = pd.DataFrame(additional_results)
+    extra['_key'] = normalize_titles(extra['title_name'])
+    # The same title can come back more than once; prefer an entry that was actually found
+    extra['_missing'] = extra['classification'] == 'N/A'
+    extra = (extra.sort_values('_missing', kind='stable')
+                  .drop_duplicates('_key', keep='first')
+                  .set_index('_key'))
+
+    not_found = results_df['classification'] == 'N/A'
+    pending = normalize_titles(results_df.loc[not_found, 'movie_name']).rename('_key').to_frame()
+    joined = pending.join(extra[['classification', 'runtime']], on='_key', how='inner')
+
+    results_df.loc[joined.index, ['classification', 'run_time']] = joined[['classification', 'runtime']].to_numpy()
+    results_df.loc[joined.index, 'label_issued_by'] = 'N/A'  # Placeholder for scrapper 2, modify as needed
+    return results_df
@@ -0,0 +1,111 @@
+import csv
+import os
+
+from openpyxl import Workbook
+
+from stage_timing import timed
+
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 500
+
+
+def partial_path_for(output_path):
+    # CSV output is readable while it is written; other formats keep a CSV journal beside them
+    if output_path.endswith('.csv'):
+        return output_path
+    return output_path + '.partial.csv'
+
+
+class CsvSink:
+    def __init__(self, path, columns):
+        self.path = path
+        self.partial_path = path
+        self.columns = list(columns)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+        self._file.flush()
+
+    def write(self, row):
+        self._writer.writerow([row.get(column, '') for column in self.columns])
+        # Flush every row so a crash or a partial download sees everything finished so far
+        self._file.flush()
+
+    def close(self, completed=True):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(completed=exc_type is None)
+
+
+class XlsxSink(CsvSink):
+    def __init__(self, path, columns):
+        super().__init__(partial_path_for(path), columns)
+        self.path = path
+        # write_only streams rows to disk on save instead of keeping a cell object per value
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+        self._sheet.append(self.columns)
+
+    def write(self, row):
+        self._sheet.append([row.get(column, '') for column in self.columns])
+        super().write(row)
+
+    def close(self, completed=True):
+        super().close(completed)
+        with timed('sink.save'):
+            self._workbook.save(self.path)
+        if completed:
+            os.remove(self.partial_path)
+
+
+class ParquetSink(CsvSink):
+    def __init__(self, path, columns):
+        # pyarrow is only needed when Parquet output is requested
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(partial_path_for(path), columns)
+        self.path = path
+        self._pa = pa
+        self._schema = pa.schema([(column, pa.string()) for column in self.columns])
+        self._writer_pq = pq.ParquetWriter(path, self._schema)
+        self._buffer = []
+
+    def _flush_row_group(self):
+        if not self._buffer:
+            return
+        data = {column: [row.get(column) for row in self._buffer] for column in self.columns}
+        self._writer_pq.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+        self._buffer = []
+
+    def write(self, row):
+        self._buffer.append({column: (None if row.get(column) is None else str(row.get(column)))
+                             for column in self.columns})
+        if len(self._buffer) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush_row_group()
+        super().write(row)
+
+    def close(self, completed=True):
+        super().close(completed)
+        self._flush_row_group()
+        self._writer_pq.close()
+        if completed:
+            os.remove(self.partial_path)
+
+
+SINKS = {
+    '.csv': CsvSink,
+    '.xlsx': XlsxSink,
+    '.parquet': ParquetSink,
+}
+
+
+def open_sink(path, columns):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"Unsupported output format: {extension}")
+    return SINKS[extension](path, columns)
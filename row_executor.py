@@ -0,0 +1,141 @@
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+from lookup_cache import is_not_found, normalize, recording_failures
+from stage_timing import timed
+
+# Rows looked up at the same time; per-site limits in site_limits still apply
+MAX_WORKERS = 4
+# Rows read ahead of the oldest unfinished one, per worker
+READ_AHEAD = 4
+# Distinct rows remembered for deduplication, least recently repeated dropped first, so memory
+# stays bounded on any sheet size. A repeat of a forgotten row is looked up again and is
+# answered by the lookup cache
+DEDUPE_KEYS = 10000
+
+
+def normalized_row(row):
+    # Dedupe key: rows that differ only in case or whitespace are the same lookup
+    return tuple(normalize(value) for value in row)
+
+
+def row_failed(row, error, on_error=None):
+    metrics.increment('scraper_row_errors_total', error=type(error).__name__)
+    logging.error(f"Error processing row {row}: {error}")
+    if on_error is None:
+        raise error
+    return False, on_error(row, error)
+
+
+def row_finished(row, result, errors):
+    # A row that found nothing while a site errored hit an outage rather than a missing title,
+    # so it is reported and checkpointed as failed and retry_failed picks it up
+    if errors and is_not_found(result):
+        metrics.increment('scraper_row_errors_total', error=errors[0])
+        logging.error(f"Lookups for row {row} failed: {', '.join(errors)}")
+        return False, result
+    return True, result
+
+
+def resolved(outcome):
+    future = Future()
+    future.set_result(outcome)
+    return future
+
+
+def iter_ordered(rows, submit, window, on_done=None, checkpoint=None, dedupe_key=None, input_fields=None):
+    # Yields one result per row in input order while only keeping a bounded window of rows
+    # in flight, so rows can be streamed in from the sheet as they are read.
+    # submit(row) starts a row and returns a Future of its (ok, result).
+    # Rows already in checkpoint.completed are re-emitted as stored instead of processed again,
+    # and rows with the same dedupe_key(row) as an earlier row reuse that row's result.
+    # input_fields(row) lists the (result field, input value) pairs a result echoes back;
+    # a reused result shows the duplicate row's own text there, not the first row's
+    # on_done(ok, deduplicated=...) is called here, on the consuming thread, as each row is
+    # yielded, so progress reporting never runs on a worker thread or the event loop
+    def finish(index, row, outcome, first_row):
+        # first_row is the row whose result a duplicate reuses, or None
+        ok, result = outcome
+        duplicate = first_row is not None
+        if index in completed:
+            metrics.increment('scraper_rows_total', outcome='restored')
+        else:
+            metrics.increment('scraper_rows_total', outcome=('deduplicated' if duplicate else 'ok') if ok else 'failed')
+        if duplicate:
+            # Every row gets its own copy, so later per-row changes don't leak between rows
+            result = dict(result) if isinstance(result, dict) else result
+            if input_fields is not None and isinstance(result, dict):
+                # Only fields still holding the first row's input are replaced, so markers
+                # such as 'Invalid Input' stay as they are
+                for (field, first_value), (_, value) in zip(input_fields(first_row), input_fields(row)):
+                    if result.get(field) == first_value:
+                        result[field] = value
+        if on_done and index not in completed:
+            on_done(ok, deduplicated=duplicate)
+        if checkpoint is not None:
+            checkpoint.save(index, ok, result)
+        return result
+
+    completed = checkpoint.completed if checkpoint is not None else {}
+    # dedupe key -> (future, row) of the first row with that key, for the last DEDUPE_KEYS keys
+    seen = OrderedDict()
+
+    def dispatch(index, row):
+        # Returns the future holding the row's outcome and, for a repeated row, the first row
+        key = dedupe_key(row) if dedupe_key is not None else None
+        if key is not None and key in seen and index not in completed:
+            seen.move_to_end(key)
+            future, first_row = seen[key]
+            return future, first_row
+        future = resolved(completed[index]) if index in completed else submit(row)
+        if key is not None and key not in seen:
+            seen[key] = (future, row)
+            if len(seen) > DEDUPE_KEYS:
+                seen.popitem(last=False)
+        return future, None
+
+    in_flight = deque()
+    try:
+        for index, row in enumerate(rows):
+            future, first_row = dispatch(index, row)
+            in_flight.append((index, row, future, first_row))
+            if len(in_flight) >= window:
+                index, row, future, first_row = in_flight.popleft()
+                yield finish(index, row, future.result(), first_row)
+        while in_flight:
+            index, row, future, first_row = in_flight.popleft()
+            yield finish(index, row, future.result(), first_row)
+    finally:
+        # Stopped early: rows that haven't started yet are dropped rather than scraped for nothing
+        for _, _, future, _ in in_flight:
+            future.cancel()
+        if checkpoint is not None:
+            checkpoint.flush()
+
+
+def iter_results(rows, process_row, max_workers=MAX_WORKERS, on_error=None, on_done=None, checkpoint=None,
+                 dedupe_key=None, input_fields=None):
+    def run(row):
+        try:
+            with timed('row'), recording_failures() as errors:
+                result = process_row(*row)
+        except Exception as e:
+            return row_failed(row, e, on_error)
+        return row_finished(row, result, errors)
+
+    if max_workers <= 1:
+        yield from iter_ordered(rows, lambda row: resolved(run(row)), 1, on_done, checkpoint, dedupe_key,
+                                input_fields)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='row') as executor:
+        yield from iter_ordered(rows, lambda row: executor.submit(run, row), max_workers * READ_AHEAD,
+                                on_done, checkpoint, dedupe_key, input_fields)
+
+
+def run_rows(rows, process_row, max_workers=MAX_WORKERS, on_error=None, on_done=None, checkpoint=None,
+             dedupe_key=None, input_fields=None):
+    return list(iter_results(rows, process_row, max_workers, on_error, on_done, checkpoint, dedupe_key,
+                             input_fields))
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+from lookup_cache import normalize
+
+# Result pages fetched per season search before giving up on finding more episodes
+SEASON_PAGES = 3
+# Episode searches kept for rows that share a search query. Rows sharing one (alternate-language
+# rows of the same episode) sit close together in a sheet, so a short history is enough
+SEARCHES_KEPT = 1000
+
+
+def season_key(season_name, season_number):
+    return normalize(season_name), normalize(season_number)
+
+
+class SeasonPlanner:
+    def __init__(self, fetch_season, fetch_search=None):
+        # fetch_season(season_name, season_number) returns the season's listings, or None
+        # when the season search itself failed and episodes should be searched one by one.
+        # fetch_search(search_query) does the same for one episode search
+        self.fetch_season = fetch_season
+        self.fetch_search = fetch_search
+        # Rows arrive as the sheet is streamed, so the plan is built up as episodes ask for it
+        self.episode_counts = Counter()
+        self.searches = 0
+        self.search_rows = 0
+        self._listings = {}
+        self._searches = OrderedDict()
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def summary(self):
+        return {'episode_rows': sum(self.episode_counts.values()), 'seasons': len(self.episode_counts),
+                'search_rows': self.search_rows, 'searches': self.searches}
+
+    def listings(self, season_name, season_number):
+        key = season_key(season_name, season_number)
+        with self._guard:
+            self.episode_counts[key] += 1
+            lock = self._locks.setdefault(key, threading.Lock())
+        # Episodes of the same season arriving on other workers wait for the first fetch
+        with lock:
+            if key not in self._listings:
+                self._listings[key] = fetch_listings(self.fetch_season, season_name, season_number)
+            return self._listings[key]
+
+    def search_listings(self, search_query):
+        # Rows with the same episode search query share one fetch of its page
+        key = normalize(search_query)
+        with self._guard:
+            self.search_rows += 1
+            entry = self._searches.get(key)
+            if entry is None:
+                self.searches += 1
+                entry = self._searches[key] = {'lock': threading.Lock()}
+                if len(self._searches) > SEARCHES_KEPT:
+                    self._searches.popitem(last=False)
+            else:
+                self._searches.move_to_end(key)
+        with entry['lock']:
+            if 'listings' not in entry:
+                entry['listings'] = fetch_listings(self.fetch_search, search_query)
+            return entry['listings']
+
+
+class AsyncSeasonPlanner(SeasonPlanner):
+    # The same plan for the async engine. The fetch functions are coroutine functions, and
+    # every episode awaits one shared fetch task instead of blocking on a lock.
+    # Only used from the engine's event loop, so no locking is needed
+    async def listings(self, season_name, season_number):
+        key = season_key(season_name, season_number)
+        self.episode_counts[key] += 1
+        if key not in self._listings:
+            self._listings[key] = asyncio.ensure_future(
+                fetch_listings_async(self.fetch_season, season_name, season_number))
+        return await asyncio.shield(self._listings[key])
+
+    async def search_listings(self, search_query):
+        key = normalize(search_query)
+        self.search_rows += 1
+        task = self._searches.get(key)
+        if task is None:
+            self.searches += 1
+            task = self._searches[key] = asyncio.ensure_future(fetch_listings_async(self.fetch_search, search_query))
+            if len(self._searches) > SEARCHES_KEPT:
+                self._searches.popitem(last=False)
+        else:
+            self._searches.move_to_end(key)
+        return await asyncio.shield(task)
+
+
+def fetch_listings(fetch, *args):
+    try:
+        return fetch(*args)
+    except Exception as e:
+        logging.error(f"Error fetching listings for {' '.join(map(str, args))}: {e}")
+        return None
+
+
+async def fetch_listings_async(fetch, *args):
+    try:
+        return await fetch(*args)
+    except Exception as e:
+        logging.error(f"Error fetching listings for {' '.join(map(str, args))}: {e}")
+        return None
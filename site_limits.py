@@ -0,0 +1,44 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlparse
+
+# Maximum concurrent requests per site, shared by every worker in the process
+SITE_LIMITS = {
+    'www.classificationoffice.govt.nz': 4,
+    'www.fvlb.org.nz': 2,
+}
+DEFAULT_SITE_LIMIT = 2
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+# Same limits for the asyncio engine. Its lookups all run on one event loop, so these
+# need no lock; a browser fallback it hands to a thread still goes through site_slot
+_async_semaphores = {}
+
+
+def site_of(url):
+    return urlparse(url).netloc or url
+
+
+def _semaphore_for(site):
+    with _semaphores_lock:
+        if site not in _semaphores:
+            _semaphores[site] = threading.BoundedSemaphore(SITE_LIMITS.get(site, DEFAULT_SITE_LIMIT))
+        return _semaphores[site]
+
+
+@contextmanager
+def site_slot(url):
+    semaphore = _semaphore_for(site_of(url))
+    with semaphore:
+        yield
+
+
+@asynccontextmanager
+async def async_site_slot(url):
+    site = site_of(url)
+    if site not in _async_semaphores:
+        _async_semaphores[site] = asyncio.BoundedSemaphore(SITE_LIMITS.get(site, DEFAULT_SITE_LIMIT))
+    async with _async_semaphores[site]:
+        yield
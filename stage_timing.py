@@ -0,0 +1,65 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from latency import Histogram, bucket_percentile
+
+# Seconds spent in each stage of a lookup, across every job in the process
+stage_latency = defaultdict(Histogram)
+
+
+@contextmanager
+def timed(stage):
+    # Also usable as a decorator
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_latency[stage].observe(time.perf_counter() - start_time)
+
+
+def observe(stage, seconds):
+    stage_latency[stage].observe(seconds)
+
+
+def mark():
+    # Counters as they are now; summary_since(mark()) only covers what happens afterwards
+    return {stage: histogram.state() for stage, histogram in list(stage_latency.items())}
+
+
+def summary_since(before=None):
+    summary = {}
+    for stage, histogram in sorted(stage_latency.items()):
+        counts, count, total = histogram.state()
+        if before and stage in before:
+            old_counts, old_count, old_total = before[stage]
+            counts = [new - old for new, old in zip(counts, old_counts)]
+            count -= old_count
+            total -= old_total
+        if not count:
+            continue
+        p50 = bucket_percentile(histogram.buckets, counts, 50)
+        p95 = bucket_percentile(histogram.buckets, counts, 95)
+        summary[stage] = {
+            'count': count,
+            'total_seconds': round(total, 3),
+            'mean_seconds': round(total / count, 6),
+            # Bucket upper bounds; None means beyond the last bucket
+            'p50': None if p50 == float('inf') else p50,
+            'p95': None if p95 == float('inf') else p95,
+        }
+    return summary
+
+
+def timings_path_for(output_path):
+    return output_path + '.timings.json'
+
+
+def write_summary(path, summary, **info):
+    with open(path, 'w') as f:
+        json.dump(dict(info, stages=summary), f, indent=2)
+    slowest = sorted(summary.items(), key=lambda item: item[1]['total_seconds'], reverse=True)[:5]
+    logging.info("Slowest stages: " + ', '.join(f"{stage} {stats['total_seconds']}s/{stats['count']}"
+                                                 for stage, stats in slowest))
@@ -0,0 +1,23 @@
+from code_mapping import iter_mapped
+
+# A row as version1moviesfinal.match_movie_film builds it from an FVLB detail page: no MR or CD
+FVLB_ROW = {
+    'movie_name': 'Bench fvlb 3',
+    'director_name': 'Fixture Director',
+    'classification': 'PG',
+    'release_year': 'N/A',
+    'run_time': '101',
+    'label_issued_by': 'N/A',
+    'label_issued_on': 'N/A',
+}
+
+
+def test_fvlb_found_row_gets_na_mr():
+    [row] = iter_mapped([dict(FVLB_ROW)], ['MR'])
+    assert row['classification'] == 'PG'
+    assert row['MR'] == 'N/A'
+
+
+def test_statement_is_mapped_to_its_code():
+    [row] = iter_mapped([{'MR': 'Suitable for  general audiences', 'CD': 'General'}], ['MR'])
+    assert row == {'MR': 'G', 'CD': 'General'}
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+
+from async_fetch import render_async
+from blocking_io import cache_io
+
+
+class SlowPool:
+    size = 2
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.threads = set()
+
+    def render(self, url, ready):
+        self.threads.add(threading.current_thread().name)
+        self.release.wait(5)
+        return url
+
+
+def test_cache_io_is_not_queued_behind_renders():
+    pool = SlowPool()
+
+    async def run():
+        # Far more renders than the default executor has threads
+        renders = [asyncio.ensure_future(render_async(pool, f'page {i}', 'listings')) for i in range(64)]
+        await asyncio.sleep(0.1)
+        start = time.time()
+        assert await cache_io(lambda: 'hit') == 'hit'
+        waited = time.time() - start
+        pool.release.set()
+        return waited, await asyncio.gather(*renders)
+
+    waited, pages = asyncio.run(run())
+    assert waited < 1
+    assert pages == [f'page {i}' for i in range(64)]
+    # Renders only ever use as many threads as the pool has browsers
+    assert len(pool.threads) == pool.size
@@ -0,0 +1,32 @@
+import row_executor
+from row_executor import iter_results, normalized_row
+
+
+def movie_fields(row):
+    return [('movie_name', row[0]), ('director_name', row[1])]
+
+
+def lookup(calls):
+    def process_row(movie_name, director_name):
+        calls.append(movie_name)
+        return {'movie_name': movie_name, 'director_name': director_name, 'classification': 'M'}
+    return process_row
+
+
+def test_repeated_row_reuses_result_with_its_own_input():
+    calls = []
+    rows = [('Inception', 'Christopher Nolan'), ('inception ', 'christopher  nolan')]
+    results = list(iter_results(rows, lookup(calls), dedupe_key=normalized_row, input_fields=movie_fields))
+    assert calls == ['Inception']
+    assert [(r['movie_name'], r['director_name']) for r in results] == rows
+
+
+def test_dedupe_memory_is_bounded(monkeypatch):
+    monkeypatch.setattr(row_executor, 'DEDUPE_KEYS', 2)
+    calls = []
+    rows = [('A', 'x'), ('B', 'x'), ('C', 'x'), ('A', 'x'), ('C', 'x')]
+    results = list(iter_results(rows, lookup(calls), max_workers=1, dedupe_key=normalized_row,
+                                input_fields=movie_fields))
+    # 'A' was forgotten once 'C' arrived, so it is looked up again; 'C' is still remembered
+    assert calls == ['A', 'B', 'C', 'A']
+    assert [r['movie_name'] for r in results] == ['A', 'B', 'C', 'A', 'C']
@@ -0,0 +1,35 @@
+from http_fetch import is_search_page
+from lookup_steps import fetch_or_render
+
+SHELL_PAGE = ('<html><body><form class="search-form" action="/find-a-rating/" method="get">'
+              '<input type="text" name="search"></form><div id="app"></div></body></html>')
+EMPTY_PAGE = ('<html><body><form class="search-form" action="/find-a-rating/" method="get"></form>'
+              '<p class="h4">No results found for "Nothing".</p></body></html>')
+LISTING_PAGE = '<html><body><div class="col-12 mb-4" data-listing><h3>Inception</h3></div></body></html>'
+
+
+def first_step_after(page_source):
+    # Runs fetch_or_render up to its second step, answering the fetch with page_source
+    steps = fetch_or_render('https://example.test/find-a-rating/?search=x', object(), 'listings', is_search_page)
+    assert next(steps)[0] == 'fetch'
+    try:
+        return steps.send(page_source)
+    except StopIteration as stop:
+        return ('done', stop.value)
+
+
+def test_shell_page_with_search_form_is_rendered():
+    assert not is_search_page(SHELL_PAGE)
+    assert first_step_after(SHELL_PAGE)[0] == 'render'
+
+
+def test_failed_fetch_is_rendered():
+    assert first_step_after(None)[0] == 'render'
+
+
+def test_no_results_page_is_final():
+    assert first_step_after(EMPTY_PAGE) == ('done', EMPTY_PAGE)
+
+
+def test_listing_page_is_final():
+    assert first_step_after(LISTING_PAGE) == ('done', LISTING_PAGE)
@@ -0,0 +1,45 @@
+import asyncio
+
+from series_planner import AsyncSeasonPlanner, SeasonPlanner
+
+QUERIES = ['Bench Show Season 1 Episode 2', 'bench show  season 1 episode 2', 'Bench Show Season 1 Episode 3']
+
+
+def test_rows_sharing_a_search_query_share_its_fetch():
+    fetched = []
+
+    def fetch_search(query):
+        fetched.append(query)
+        return [query]
+
+    planner = SeasonPlanner(None, fetch_search)
+    results = [planner.search_listings(query) for query in QUERIES]
+    assert fetched == [QUERIES[0], QUERIES[2]]
+    assert results == [[QUERIES[0]], [QUERIES[0]], [QUERIES[2]]]
+    assert planner.summary()['search_rows'] == 3
+    assert planner.summary()['searches'] == 2
+
+
+def test_async_rows_sharing_a_search_query_share_its_fetch():
+    fetched = []
+
+    async def fetch_search(query):
+        fetched.append(query)
+        await asyncio.sleep(0.01)
+        return [query]
+
+    async def run():
+        planner = AsyncSeasonPlanner(None, fetch_search)
+        return await asyncio.gather(*(planner.search_listings(query) for query in QUERIES))
+
+    assert asyncio.run(run()) == [[QUERIES[0]], [QUERIES[0]], [QUERIES[2]]]
+    assert fetched == [QUERIES[0], QUERIES[2]]
+
+
+def test_failed_search_is_shared_as_none():
+    def fetch_search(query):
+        raise ConnectionError(query)
+
+    planner = SeasonPlanner(None, fetch_search)
+    assert planner.search_listings(QUERIES[0]) is None
+    assert planner.search_listings(QUERIES[1]) is None
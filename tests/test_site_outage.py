@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in its own process and working directory: the app reads the site URLs on import and
+# keeps its job queue, caches and worker thread in the current directory
+SCENARIO = r'''
+import json, socket, sys, threading, time
+from openpyxl import Workbook
+
+# Both sites point at a port that accepts connections and drops them straight away
+listener = socket.socket()
+listener.bind(('127.0.0.1', 0))
+listener.listen(64)
+port = listener.getsockname()[1]
+connections = []
+
+def refuse():
+    while True:
+        conn, _ = listener.accept()
+        connections.append(1)
+        conn.close()
+
+threading.Thread(target=refuse, daemon=True).start()
+
+import os
+os.environ['CLASSIFICATION_OFFICE_URL'] = f'http://127.0.0.1:{port}/'
+os.environ['FVLB_URL'] = f'http://127.0.0.1:{port}/'
+os.environ['SCRAPER_BROWSER'] = '0'
+sys.path.insert(0, sys.argv[1])
+
+from rate_limiter import RATE_LIMITS
+from site_limits import SITE_LIMITS
+RATE_LIMITS[f'127.0.0.1:{port}'] = {'rate': 10000.0, 'burst': 10000, 'adaptive': False}
+SITE_LIMITS[f'127.0.0.1:{port}'] = 64
+
+import version1moviesfinal as app_module
+
+workbook = Workbook()
+workbook.active.append(['Movie_name', 'Director_name'])
+for i in range(5):
+    workbook.active.append([f'Outage title {i}', 'Christopher Nolan'])
+workbook.save('upload.xlsx')
+
+client = app_module.app.test_client()
+
+def wait(job_id):
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        status = client.get(f'/jobs/{job_id}').get_json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.2)
+    raise RuntimeError('job did not finish')
+
+with open('upload.xlsx', 'rb') as f:
+    job_id = client.post('/upload', data={'file': (f, 'upload.xlsx')},
+                         content_type='multipart/form-data').get_json()['job_id']
+first = wait(job_id)
+connections_before_retry = len(connections)
+retry = client.post(f'/jobs/{job_id}/retry').status_code
+second = wait(job_id)
+print(json.dumps({'first': first, 'retry': retry, 'second': second,
+                  'retried_connections': len(connections) - connections_before_retry}))
+'''
+
+
+def test_rows_hit_by_a_site_outage_are_failed_and_retried(tmp_path):
+    env = dict(os.environ, SCRAPER_ENGINE=os.environ.get('SCRAPER_ENGINE', 'async'))
+    output = subprocess.run([sys.executable, '-c', SCENARIO, ROOT], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=300, check=True).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+
+    assert report['first']['status'] == 'done'
+    assert report['first']['rows_failed'] == 5
+    assert report['first']['rows_done'] == 0
+    # Retrying re-runs the failed rows against the sites instead of restoring them
+    assert report['retry'] == 200
+    assert report['retried_connections'] > 0
+    assert report['second']['rows_failed'] == 5
@@ -1,11 +1,26 @@
 import datetime
-import pandas as pd
-from bs4 import BeautifulSoup
-from helium import start_chrome, write, click, S, find_all, get_driver
-import time
-from flask import Flask, request, send_file, jsonify
+import os
+from flask import Flask, Response, request, send_file, jsonify
 import logging
 import re
+import functools
+from async_engine import async_enabled, iter_results_async
+from browser_pool import new_browser_pool
+from code_mapping import iter_mapped
+from excel_stream import SERIES_COLUMNS, count_rows, iter_rows
+import fvlb_client
+from job_queue import job_queue
+import metrics
+from page_cache import replay_enabled
+import job_storage
+from lookup_cache import lookup_cache, mark_failed
+from http_fetch import is_search_page
+from listing_extractor import SEARCH_URL, extract_listings, release_year_from
+from lookup_steps import call, fetch, fetch_or_render, render, run_steps, run_steps_async, sleep
+from result_sink import open_sink, partial_path_for
+from row_executor import iter_results, normalized_row
+from stage_timing import timed
+from series_planner import SEASON_PAGES, AsyncSeasonPlanner, SeasonPlanner
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -13,225 +28,383 @@ logging.basicConfig(level=logging.DEBUG)
 # File paths
 output_file_path = 'series_ratings.xlsx'
 
-def wait_for_element(selector, timeout=10):
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        if selector.exists():
-            return True
-        time.sleep(0.5)
-    return False
+# Columns of the results sheet, in order
+output_columns = ['season_name', 'episode_name', 'director_name', 'classification', 'release_year', 'run_time',
+                  'label_issued_by', 'label_issued_on', 'MR', 'CD']
+
+# Warm headless Chrome instances (or tabs of one Chrome) shared by every lookup in this process
+browser_pool = new_browser_pool()
 
 def is_valid_director_name(name):
     return bool(name) and re.match("^[a-zA-Z ]+$", name)
 
-def get_series_details_from_website(season_name, episode_name, director_name, retries=1):
-    base_url = "https://www.classificationoffice.govt.nz/find-a-rating/?search="
-    search_url = base_url + season_name.replace(" ", "+")
-
-    for attempt in range(retries):
-        try:
-            browser = start_chrome(search_url, headless=True)
-            time.sleep(5)  # Wait for the page to load
-            page_source = browser.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-            listings = soup.find_all('div', {'data-listing': ''})
-
-            for listing in listings:
-                title_tag = listing.find('h3', class_='h2')
-                if not title_tag:
-                    continue
-                title = title_tag.get_text(strip=True)
-
-                if episode_name.lower() in title.lower() and director_name.lower() in title.lower():
-                    # Extract classification
-                    classification_tag = listing.find('p', class_='large mb-2')
-                    classification = classification_tag.get_text(strip=True) if classification_tag else 'N/A'
-
-                    # Extract MR (e.g., "Parental guidance recommended for younger viewers")
-                    mr_tag = listing.find('p', class_='large')
-                    mr_text = mr_tag.get_text(strip=True) if mr_tag else 'N/A'
-
-                    # Extract the release year, runtime, label, and label issued on
-                    table = listing.find('table', class_='rating-result-table')
-                    run_time = 'N/A'
-                    label_issued_by = 'N/A'
-                    label_issued_on = 'N/A'
-                    if table:
-                        lines = table.get_text(separator="\n", strip=True).split('\n')
-                        for i, line in enumerate(lines):
-                            if 'Running time:' in line:
-                                run_time = lines[i + 1].strip()
-                            elif 'Label issued by:' in line:
-                                label_issued_by = lines[i + 1].strip()
-                            elif 'Label issued on:' in line:
-                                label_issued_on = lines[i + 1].strip()
-
-                    parts = title.split(',')
-                    release_year = parts[0].strip() if len(parts) > 1 else 'N/A'
-
-                    browser.quit()
-                    return {
-                        'season_name': season_name,
-                        'episode_name': episode_name,
-                        'director_name': director_name,
-                        'classification': classification,
-                        'release_year': release_year,
-                        'run_time': run_time,
-                        'label_issued_by': label_issued_by,
-                        'label_issued_on': label_issued_on,
-                        'MR': mr_text,  # Additional field for MR
-                        'CD': classification  # Additional field for CD
-                    }
-
-                if episode_name.lower() not in title.lower() and director_name.lower() in title.lower():
-                    browser.quit()
-                    return {
-                        'season_name': season_name,
-                        'episode_name': episode_name,
-                        'director_name': director_name,
-                        'classification': 'N/A',
-                        'release_year': 'N/A',
-                        'run_time': 'N/A',
-                        'label_issued_by': 'N/A',
-                        'label_issued_on': 'N/A',
-                        'MR': 'N/A',
-                        'CD': 'Season present - Couldn\'t find particular episode'
-                    }
-
-                if episode_name.lower() in title.lower() and director_name.lower() not in title.lower():
-                    browser.quit()
-                    return {
-                        'season_name': season_name,
-                        'episode_name': episode_name,
-                        'director_name': director_name,
-                        'classification': 'N/A',
-                        'release_year': 'N/A',
-                        'run_time': 'N/A',
-                        'label_issued_by': 'N/A',
-                        'label_issued_on': 'N/A',
-                        'MR': 'N/A',
-                        'CD': 'Season & Episode present - Director not matched'
-                    }
-
-            browser.quit()
+@timed('match.listings')
+def match_series_listings(listings, season_name, episode_name, director_name, partial=True):
+    # partial=False only accepts a listing with both the episode and the director
+    episode_match = director_match = None
+    for listing in listings:
+        if not listing.title:
+            continue
+        title = listing.title.lower()
+        has_episode = episode_name.lower() in title
+        has_director = director_name.lower() in title
+
+        if has_episode and has_director:
             return {
                 'season_name': season_name,
                 'episode_name': episode_name,
                 'director_name': director_name,
-                'classification': 'N/A',
-                'release_year': 'N/A',
-                'run_time': 'N/A',
-                'label_issued_by': 'N/A',
-                'label_issued_on': 'N/A',
-                'MR': 'N/A',
-                'CD': 'Season Present - Episode & Director not Found'
+                'classification': listing.classification,
+                'release_year': release_year_from(listing.title),
+                'run_time': listing.run_time,
+                'label_issued_by': listing.label_issued_by,
+                'label_issued_on': listing.label_issued_on,
+                'MR': listing.mr_text,  # Additional field for MR
+                'CD': listing.classification  # Additional field for CD
             }
+        # Partial matches only count if no listing matches both episode and director
+        if has_director and director_match is None:
+            director_match = listing
+        if has_episode and episode_match is None:
+            episode_match = listing
+
+    if not partial:
+        return None
+
+    if director_match:
+        return {
+            'season_name': season_name,
+            'episode_name': episode_name,
+            'director_name': director_name,
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'Season present - Couldn\'t find particular episode'
+        }
+
+    if episode_match:
+        return {
+            'season_name': season_name,
+            'episode_name': episode_name,
+            'director_name': director_name,
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'Season & Episode present - Director not matched'
+        }
+
+    return None
+
+def series_details_from_listings(listings, season_name, episode_name, director_name):
+    details = match_series_listings(listings, season_name, episode_name, director_name)
+    if details:
+        return details
+    return {
+        'season_name': season_name,
+        'episode_name': episode_name,
+        'director_name': director_name,
+        'classification': 'N/A',
+        'release_year': 'N/A',
+        'run_time': 'N/A',
+        'label_issued_by': 'N/A',
+        'label_issued_on': 'N/A',
+        'MR': 'N/A',
+        'CD': 'Season Present - Episode & Director not Found'
+    }
+
+def season_search_url(season_name, season_number, page):
+    base_url = SEARCH_URL
+    search_query = f"{season_name} Season {season_number}"
+    search_url = base_url + search_query.replace(" ", "+")
+    if page > 1:
+        search_url += f"&page={page}"
+    return search_url
+
+def season_listings_steps(season_name, season_number):
+    # Lookup steps shared by both engines; see lookup_steps
+    listings = []
+    seen_titles = set()
+    for page in range(1, SEASON_PAGES + 1):
+        search_url = season_search_url(season_name, season_number, page)
+
+        page_source = yield fetch(search_url)
+        if not is_search_page(page_source):
+            if page > 1:
+                break
+            page_source = yield render(browser_pool, search_url, 'listings')
+
+        page_listings = [listing for listing in extract_listings(page_source or '') if listing.title not in seen_titles]
+        if not page_listings:
+            break
+        seen_titles.update(listing.title for listing in page_listings)
+        listings.extend(page_listings)
+    return listings
+
+def fetch_season_listings(season_name, season_number):
+    return run_steps(season_listings_steps(season_name, season_number))
+
+async def fetch_season_listings_async(season_name, season_number):
+    return await run_steps_async(season_listings_steps(season_name, season_number))
+
+def episode_identity(season_name, season_number, episode_number, episode_name, director_name):
+    return {'season_name': f"{season_name} Season {season_number} Episode {episode_number}",
+            'episode_name': episode_name, 'director_name': director_name}
+
+def series_identity(season_name, episode_name, director_name):
+    return {'season_name': season_name, 'episode_name': episode_name, 'director_name': director_name}
+
+def series_input_fields(row):
+    # Result fields that echo the row's input, re-stamped on repeated rows that reuse a result.
+    # season_name comes back either as entered or as the episode search query
+    return [('season_name', row[0])] + list(episode_identity(*row).items())
+
+def series_season_steps(season_name, season_number, episode_number, episode_name, director_name, seasons):
+    listings = yield call(seasons.listings, season_name, season_number)
+    if listings is None:
+        mark_failed()
+    if not listings:
+        # Season search failed or came back empty; fall back to the per-episode search
+        return None
+    # None unless a listing matches both episode and director, so the episode is searched on its
+    # own; the season's first pages may not include it even when the director appears there
+    search_query = f"{season_name} Season {season_number} Episode {episode_number}"
+    return match_series_listings(listings, search_query, episode_name, director_name, partial=False)
+
+@lookup_cache.cached('classificationoffice_season', identity=episode_identity)
+def get_series_details_from_season(season_name, season_number, episode_number, episode_name, director_name, seasons=None):
+    return run_steps(series_season_steps(season_name, season_number, episode_number, episode_name, director_name,
+                                         seasons))
+
+@lookup_cache.cached_async('classificationoffice_season', identity=episode_identity)
+async def get_series_details_from_season_async(season_name, season_number, episode_number, episode_name,
+                                               director_name, seasons=None):
+    return await run_steps_async(series_season_steps(season_name, season_number, episode_number, episode_name,
+                                                     director_name, seasons))
+
+def episode_search_steps(search_query):
+    # Listings of one episode search, or None when the page couldn't be fetched
+    search_url = SEARCH_URL + search_query.replace(" ", "+")
+    # The search page is server-rendered, so a plain GET is usually enough
+    page_source = yield from fetch_or_render(search_url, browser_pool, 'listings', is_search_page)
+    return extract_listings(page_source) if page_source else None
+
+def fetch_episode_search(search_query):
+    return run_steps(episode_search_steps(search_query))
+
+async def fetch_episode_search_async(search_query):
+    return await run_steps_async(episode_search_steps(search_query))
+
+def series_website_steps(season_name, episode_name, director_name, retries=1, seasons=None):
+    for attempt in range(retries):
+        try:
+            if seasons is not None:
+                # Rows with the same search query, such as alternate-language rows of one
+                # episode, share one fetch of its page
+                listings = yield call(seasons.search_listings, season_name)
+            else:
+                listings = yield from episode_search_steps(season_name)
+            if listings is None:
+                mark_failed()
+
+            return series_details_from_listings(listings or [], season_name, episode_name, director_name)
         except Exception as e:
             logging.error(f"Error fetching details for {season_name} from website 1 (attempt {attempt+1}/{retries}): {e}")
-            time.sleep(5)  # Wait before retrying
+            mark_failed(e)
+            yield sleep(5)  # Wait before retrying
     return None
 
-def get_series_details_from_nz_website(season_name, episode_name, director_name, retries=1):
-    base_url = "https://www.fvlb.org.nz/"
-    browser = start_chrome(base_url, headless=True)
+@lookup_cache.cached('classificationoffice', identity=series_identity)
+def get_series_details_from_website(season_name, episode_name, director_name, retries=1, seasons=None):
+    return run_steps(series_website_steps(season_name, episode_name, director_name, retries, seasons))
+
+@lookup_cache.cached_async('classificationoffice', identity=series_identity)
+async def get_series_details_from_website_async(season_name, episode_name, director_name, retries=1,
+                                                seasons=None):
+    return await run_steps_async(series_website_steps(season_name, episode_name, director_name, retries, seasons))
+
+def match_series_film(film, season_name, episode_name, director_name):
+    title_name = film['title_name']
+    dir_name = film['dir_name']
+
+    if episode_name.lower() in title_name.lower() and director_name.lower() in dir_name.lower():
+        return {
+            'season_name': season_name,
+            'episode_name': episode_name,
+            'director_name': director_name,
+            'classification': film['classification'],
+            'release_year': 'N/A',  # Not available
+            'run_time': film['runtime'],
+            'label_issued_by': 'N/A',  # Placeholder
+            'label_issued_on': 'N/A'  # Placeholder
+        }
+
+    if episode_name.lower() not in title_name.lower() and director_name.lower() in dir_name.lower():
+        return {
+            'season_name': season_name,
+            'episode_name': episode_name,
+            'director_name': director_name,
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'Season present - Couldn\'t find particular episode'
+        }
+
+    if episode_name.lower() in title_name.lower() and director_name.lower() not in dir_name.lower():
+        return {
+            'season_name': season_name,
+            'episode_name': episode_name,
+            'director_name': director_name,
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'Season & Episode present - Director not matched'
+        }
+
+    return None
 
+def series_fvlb_not_found(season_name, episode_name, director_name, cd):
+    return {
+        'season_name': season_name,
+        'episode_name': episode_name,
+        'director_name': director_name,
+        'classification': 'N/A',
+        'release_year': 'N/A',
+        'run_time': 'N/A',
+        'label_issued_by': 'N/A',
+        'label_issued_on': 'N/A',
+        'MR': 'N/A',
+        'CD': cd
+    }
+
+def series_nz_website_steps(season_name, episode_name, director_name, retries=1):
     for attempt in range(retries):
         try:
-            search_title_input = S("#fvlb-input")
-            exact_match_checkbox = S("#ExactSearch")
-            search_button = S(".submitBtn")
-
-            write(season_name, into=search_title_input)
-            click(exact_match_checkbox)
-            click(search_button)
-
-            if not wait_for_element(S('.result-title')):
-                browser.quit()
-                return {
-                    'season_name': season_name,
-                    'episode_name': episode_name,
-                    'director_name': director_name,
-                    'classification': 'N/A',
-                    'release_year': 'N/A',
-                    'run_time': 'N/A',
-                    'label_issued_by': 'N/A',
-                    'label_issued_on': 'N/A',
-                    'MR': 'N/A',
-                    'CD': 'Season - Not Found'
-                }
-
-            time.sleep(3)  # Wait for search results
-
-            movie_links = find_all(S('.result-title'))
-            for link in movie_links:
-                if season_name.lower() in link.web_element.text.strip().lower():
-                    click(link)
-                    time.sleep(1)
-
-                    page_source = get_driver().page_source
-                    soup = BeautifulSoup(page_source, 'html.parser')
-
-                    title_element = soup.find('h1')
-                    title_name = title_element.text.strip() if title_element else 'N/A'
-
-                    director_element = soup.find('div', class_='film-director')
-                    dir_name = director_element.text.strip().replace('Directed by ', '') if director_element else 'N/A'
-
-                    if episode_name.lower() in title_name.lower() and director_name.lower() in dir_name.lower():
-                        classification_element = soup.find('div', class_='film-classification')
-                        classification = classification_element.text.strip() if classification_element else 'N/A'
-
-                        runtime_element = soup.find_all('div', class_='film-approved')[1]
-                        runtime = runtime_element.text.strip().replace('This title has a runtime of ', '').replace(' minutes.', 'N/A')
-
-                        browser.quit()
-                        return {
-                            'season_name': season_name,
-                            'episode_name': episode_name,
-                            'director_name': director_name,
-                            'classification': classification,
-                            'release_year': 'N/A',  # Not available
-                            'run_time': runtime,
-                            'label_issued_by': 'N/A',  # Placeholder
-                            'label_issued_on': 'N/A'  # Placeholder
-                        }
-
-                    if episode_name.lower() not in title_name.lower() and director_name.lower() in dir_name.lower():
-                        browser.quit()
-                        return {
-                            'season_name': season_name,
-                            'episode_name': episode_name,
-                            'director_name': director_name,
-                            'classification': 'N/A',
-                            'release_year': 'N/A',
-                            'run_time': 'N/A',
-                            'label_issued_by': 'N/A',
-                            'label_issued_on': 'N/A',
-                            'MR': 'N/A',
-                            'CD': 'Season present - Couldn\'t find particular episode'
-                        }
-
-                    if episode_name.lower() in title_name.lower() and director_name.lower() not in dir_name.lower():
-                        browser.quit()
-                        return {
-                            'season_name': season_name,
-                            'episode_name': episode_name,
-                            'director_name': director_name,
-                            'classification': 'N/A',
-                            'release_year': 'N/A',
-                            'run_time': 'N/A',
-                            'label_issued_by': 'N/A',
-                            'label_issued_on': 'N/A',
-                            'MR': 'N/A',
-                            'CD': 'Season & Episode present - Director not matched'
-                        }
-
-            browser.back()
+            movie_links = yield from fvlb_client.search_steps(season_name, browser_pool)
+            if not movie_links:
+                return series_fvlb_not_found(season_name, episode_name, director_name, 'Season - Not Found')
+
+            for link_text, link_url in movie_links:
+                if link_url and season_name.lower() in link_text.lower():
+                    page_source = yield from fvlb_client.detail_page_steps(link_url, browser_pool)
+                    if not page_source:
+                        continue
+                    details = match_series_film(fvlb_client.parse_detail_page(page_source), season_name,
+                                                episode_name, director_name)
+                    if details:
+                        return details
         except Exception as e:
             logging.error(f"Error fetching details for {season_name} from NZ website (attempt {attempt+1}/{retries}): {e}")
-            time.sleep(5)  # Wait before retrying
+            mark_failed(e)
+            yield sleep(5)  # Wait before retrying
+
+    return series_fvlb_not_found(season_name, episode_name, director_name,
+                                 'Season Present - Episode & Director not Found')
 
-    get_driver().quit()
+@lookup_cache.cached('fvlb', identity=series_identity)
+def get_series_details_from_nz_website(season_name, episode_name, director_name, retries=1):
+    return run_steps(series_nz_website_steps(season_name, episode_name, director_name, retries))
+
+@lookup_cache.cached_async('fvlb', identity=series_identity)
+async def get_series_details_from_nz_website_async(season_name, episode_name, director_name, retries=1):
+    return await run_steps_async(series_nz_website_steps(season_name, episode_name, director_name, retries))
+
+def process_series_row(season_name, season_number, episode_number, episode_name, director_name, seasons=None):
+    # Handle missing Season_name or Director_name
+    if not season_name.strip():  # Check for empty strings after conversion
+        return {
+            'season_name': 'No Season Name',
+            'episode_name': episode_name,
+            'director_name': director_name or 'No Director Details',
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'N/A'
+        }
+
+    if not is_valid_director_name(director_name.strip()):  # Check for empty strings after conversion
+        return {
+            'season_name': season_name,
+            'episode_name': episode_name,
+            'director_name': 'Invalid Input',
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'N/A'
+        }
+
+    # Create search query with Season_name, Season_number, Episode_number
+    search_query = f"{season_name} Season {season_number} Episode {episode_number}"
+
+    details = None
+    if seasons is not None:
+        # Match against the season's listings, fetched once for every episode of the season
+        details = get_series_details_from_season(season_name, season_number, episode_number, episode_name,
+                                                 director_name, seasons=seasons)
+    if not details:
+        # Attempt to get details from the first website
+        details = get_series_details_from_website(search_query, episode_name, director_name, seasons=seasons)
+    if not details:
+        # Attempt to get details from the NZ website
+        details = get_series_details_from_nz_website(search_query, episode_name, director_name)
+
+    # If details are still not found, use default values
+    if not details:
+        details = {
+            'season_name': season_name,
+            'episode_name': episode_name,
+            'director_name': director_name,
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'N/A'
+        }
+
+    return details
+
+async def process_series_row_async(season_name, season_number, episode_number, episode_name, director_name,
+                                   seasons=None):
+    if not season_name.strip() or not is_valid_director_name(director_name.strip()):
+        # Nothing to look up
+        return process_series_row(season_name, season_number, episode_number, episode_name, director_name)
+
+    # Same order as process_series_row; awaiting a page lets other rows run in the meantime
+    search_query = f"{season_name} Season {season_number} Episode {episode_number}"
+
+    details = None
+    if seasons is not None:
+        details = await get_series_details_from_season_async(season_name, season_number, episode_number,
+                                                             episode_name, director_name, seasons=seasons)
+    if not details:
+        details = await get_series_details_from_website_async(search_query, episode_name, director_name,
+                                                              seasons=seasons)
+    if not details:
+        details = await get_series_details_from_nz_website_async(search_query, episode_name, director_name)
+    return details or series_row_error((season_name, season_number, episode_number, episode_name, director_name),
+                                       None)
+
+def series_row_error(row, error):
+    season_name, season_number, episode_number, episode_name, director_name = row
     return {
         'season_name': season_name,
         'episode_name': episode_name,
@@ -242,113 +415,64 @@ def get_series_details_from_nz_website(season_name, episode_name, director_name,
         'label_issued_by': 'N/A',
         'label_issued_on': 'N/A',
         'MR': 'N/A',
-        'CD': 'Season Present - Episode & Director not Found'
+        'CD': 'N/A'
     }
 
+def run_series_job(job, progress, checkpoint=None):
+    # Stream the sheet row by row as strings, reading only the columns the lookup needs
+    progress(rows_total=count_rows(job['input_path']))
+    # The first total is the sheet's size; it is corrected to the rows actually read once reading ends
+    rows = iter_rows(job['input_path'], SERIES_COLUMNS, on_total=lambda total: progress(rows_total=total))
+    if async_enabled():
+        seasons = AsyncSeasonPlanner(fetch_season_listings_async, fetch_episode_search_async)
+        process_row = functools.partial(process_series_row_async, seasons=seasons)
+    else:
+        seasons = SeasonPlanner(fetch_season_listings, fetch_episode_search)
+        process_row = functools.partial(process_series_row, seasons=seasons)
+
+    filename = job_storage.output_path(job['id'], output_file_path)
+    job_queue.update(job['id'], output_path=filename)
+
+    # Each finished row is appended to the output straight away, so a partial file can be
+    # downloaded while the job runs and a crash doesn't lose the rows already done
+    with open_sink(job_storage.working_path(filename), output_columns) as sink:
+        # Rows are looked up concurrently as they are read; results come back in input order.
+        # Repeated rows are looked up once and the result is copied to every occurrence
+        if async_enabled():
+            # Lookups run as coroutines on the shared event loop, many rows at a time
+            results = iter_results_async(rows, process_row, on_error=series_row_error, on_done=progress,
+                                         checkpoint=checkpoint, dedupe_key=normalized_row,
+                                         input_fields=series_input_fields)
+        else:
+            results = iter_results(rows, process_row, on_error=series_row_error, on_done=progress,
+                                   checkpoint=checkpoint, dedupe_key=normalized_row,
+                                   input_fields=series_input_fields)
+        # MR statements are mapped to codes as each row comes back
+        for details in iter_mapped(results, ['MR']):
+            with timed('sink.write'):
+                sink.write(details)
+    logging.info(f"Series plan: {seasons.summary()}")
+    logging.info(f"Lookup cache stats: {lookup_cache.snapshot()}")
+    # Rename into place only once every row is written
+    return job_storage.publish(filename)
+
+job_queue.register('series', run_series_job)
+
+# Workers start with the app, so queued and checkpointed jobs resume after a restart without
+# waiting for a request. replay.py imports this module only to call the job handler, so in
+# replay mode no worker may claim real jobs from the shared queue
+if not replay_enabled():
+    job_queue.start_workers()
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
         file = request.files['file']
         if file.filename.endswith('.xlsx'):
-            # Process the Excel file
-            df = pd.read_excel(file)
-
-            # Convert all columns to strings to handle NaN values
-            df = df.astype(str)
-
-            season_names = df['Season_name'].tolist()
-            season_numbers = df['Season_number'].tolist()
-            episode_numbers = df['Episode_number'].tolist()
-            episode_names = df['Episode_name'].tolist()
-            director_names = df['Director_name'].tolist()
-
-            # Mapping MR statements to codes (remains unchanged)
-            mr_mapping = {
-                "Suitable for general audiences": "G",
-                "Parental guidance recommended for younger viewers": "PG",
-                "Suitable for mature audiences": "M",
-                "Unsuitable for audiences under 13 years of age": "13",
-                "Restricted to persons 13 years and over": "R13",
-                "Restricted to persons 13 years and over unless accompanied by a parent or guardian": "RP13",
-                "Restricted to persons 15 years and over": "R15",
-                "Unsuitable for audiences under 16 years of age": "16",
-                "Restricted to persons 16 years and over": "R16",
-                "Restricted to persons 16 years and over unless accompanied by a parent or guardian": "RP16",
-                "Unsuitable for audiences under 18 years of age": "18",
-                "Restricted to persons 18 years and over": "R18",
-                "Restricted to persons 17 years and over unless accompanied by a parent or guardian": "RP18"
-            }
+            # Queue the sheet and return straight away; progress is polled from /jobs/<job_id>
+            job_id = job_queue.enqueue('series', file)
 
-            results = []
-            for season_name, season_number, episode_number, episode_name, director_name in zip(season_names, season_numbers, episode_numbers, episode_names, director_names):
-                
-                # Handle missing Season_name or Director_name
-                if not season_name.strip():  # Check for empty strings after conversion
-                    results.append({
-                        'season_name': 'No Season Name',
-                        'episode_name': episode_name,
-                        'director_name': director_name or 'No Director Details',
-                        'classification': 'N/A',
-                        'release_year': 'N/A',
-                        'run_time': 'N/A',
-                        'label_issued_by': 'N/A',
-                        'label_issued_on': 'N/A',
-                        'MR': 'N/A',
-                        'CD': 'N/A'
-                    })
-                    continue
-
-                if not is_valid_director_name(director_name.strip()):  # Check for empty strings after conversion
-                    results.append({
-                        'season_name': season_name,
-                        'episode_name': episode_name,
-                        'director_name': 'Invalid Input',
-                        'classification': 'N/A',
-                        'release_year': 'N/A',
-                        'run_time': 'N/A',
-                        'label_issued_by': 'N/A',
-                        'label_issued_on': 'N/A',
-                        'MR': 'N/A',
-                        'CD': 'N/A'
-                    })
-                    continue
-
-                # Create search query with Season_name, Season_number, Episode_number
-                search_query = f"{season_name} Season {season_number} Episode {episode_number}"
-
-                # Attempt to get details from the first website
-                details = get_series_details_from_website(search_query, episode_name, director_name)
-                if not details:
-                    # Attempt to get details from the NZ website
-                    details = get_series_details_from_nz_website(search_query, episode_name, director_name)
-
-                # If details are still not found, use default values
-                if not details:
-                    details = {
-                        'season_name': season_name,
-                        'episode_name': episode_name,
-                        'director_name': director_name,
-                        'classification': 'N/A',
-                        'release_year': 'N/A',
-                        'run_time': 'N/A',
-                        'label_issued_by': 'N/A',
-                        'label_issued_on': 'N/A',
-                        'MR': 'N/A',
-                        'CD': 'N/A'
-                    }
-                
-                # Map MR statement to code
-                mr_statement = details.get('MR', 'N/A')
-                details['MR'] = mr_mapping.get(mr_statement, mr_statement)  # Convert MR to code, if possible
-
-                results.append(details)
-
-            # Save the combined results to an Excel file
-            results_df = pd.DataFrame(results)
-            filename = 'series_ratings.xlsx'
-            results_df.to_excel(filename, index=False)
-
-            return jsonify({'download_url': f'/download/{filename}'})
+            return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
         else:
             return jsonify({'error': 'Invalid file format. Please upload an Excel file with .xlsx extension.'})
     except Exception as e:
@@ -356,9 +480,48 @@ def upload_file():
         return jsonify({'error': 'An error occurred while processing the file. Please try again.'})
 
 
-@app.route('/download/<filename>', methods=['GET'])
-def download_file(filename):
-    return send_file(filename, as_attachment=True)
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job id.'}), 404
+    output_path = status.pop('output_path')
+    if status['status'] == 'done':
+        status['download_url'] = f'/download/{job_id}'
+    elif output_path:
+        status['partial_download_url'] = f'/jobs/{job_id}/partial'
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/partial', methods=['GET'])
+def download_partial(job_id):
+    job = job_queue.get(job_id)
+    if job is None or not job['output_path']:
+        return jsonify({'error': 'No output for this job yet.'}), 404
+    if job['status'] == 'done':
+        return send_file(job['output_path'], as_attachment=True)
+    partial_path = partial_path_for(job_storage.working_path(job['output_path']))
+    if not os.path.exists(partial_path):
+        return jsonify({'error': 'No output for this job yet.'}), 404
+    return send_file(partial_path, as_attachment=True)
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    # Re-runs only the rows that failed; finished rows come from the job's checkpoint
+    if not job_queue.retry_failed(job_id):
+        return jsonify({'error': 'Only finished or failed jobs can be retried.'}), 409
+    return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
+
+@app.route('/download/<job_id>', methods=['GET'])
+def download_file(job_id):
+    job = job_queue.get(job_id) if job_storage.is_job_id(job_id) else None
+    if job is None or job['status'] != 'done' or not job['output_path'] or not os.path.exists(job['output_path']):
+        return jsonify({'error': 'No finished output for this job.'}), 404
+    return send_file(job['output_path'], as_attachment=True)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(job_queue=job_queue, browser_pool=browser_pool, lookup_cache=lookup_cache),
+                    content_type=metrics.CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,11 +1,24 @@
 import datetime
-import pandas as pd
-from bs4 import BeautifulSoup
-from helium import start_chrome, write, click, S, find_all, get_driver
-import time
-from flask import Flask, request, send_file, jsonify
+import os
+from flask import Flask, Response, request, send_file, jsonify
 import logging
 import re
+from async_engine import async_enabled, iter_results_async
+from browser_pool import new_browser_pool
+from code_mapping import iter_mapped
+from excel_stream import MOVIE_COLUMNS, count_rows, iter_rows
+import fvlb_client
+from job_queue import job_queue
+import metrics
+from page_cache import replay_enabled
+import job_storage
+from lookup_cache import lookup_cache, mark_failed
+from http_fetch import is_search_page
+from listing_extractor import SEARCH_URL, extract_listings, release_year_from
+from lookup_steps import fetch_or_render, run_steps, run_steps_async, sleep
+from result_sink import open_sink, partial_path_for
+from row_executor import iter_results, normalized_row
+from stage_timing import timed
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -13,233 +26,276 @@ logging.basicConfig(level=logging.DEBUG)
 # File paths
 output_file_path = 'movie_ratings.xlsx'
 
-def wait_for_element(selector, timeout=10):
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        if selector.exists():
-            return True
-        time.sleep(0.5)
-    return False
+# Columns of the results sheet, in order
+output_columns = ['movie_name', 'director_name', 'classification', 'release_year', 'run_time',
+                  'label_issued_by', 'label_issued_on', 'MR', 'CD']
+
+# Warm headless Chrome instances (or tabs of one Chrome) shared by every lookup in this process
+browser_pool = new_browser_pool()
 
 def is_valid_director_name(name):
     return bool(name) and re.match("^[a-zA-Z ]+$", name)
 
-def get_movie_details_from_website(movie_name, director_name, retries=1):
-    base_url = "https://www.classificationoffice.govt.nz/find-a-rating/?search="
+def parse_movie_listings(page_source, movie_name, director_name):
+    return match_movie_listings(extract_listings(page_source), movie_name, director_name)
+
+@timed('match.listings')
+def match_movie_listings(listings, movie_name, director_name):
+    for listing in listings:
+        if not listing.title or not listing.director_text:
+            continue
+        if director_name.lower() in listing.director_text.lower():
+            return {
+                'movie_name': movie_name,
+                'director_name': director_name,
+                'classification': listing.classification,
+                'release_year': release_year_from(listing.director_text),
+                'run_time': listing.run_time,
+                'label_issued_by': listing.label_issued_by,
+                'label_issued_on': listing.label_issued_on,
+                'MR': listing.mr_text,  # Additional field for MR
+                'CD': listing.classification  # Additional field for CD
+            }
+    return None
+
+def match_movie_film(film, movie_name, director_name):
+    if director_name.lower() in film['dir_name'].lower():
+        return {
+            'movie_name': movie_name,
+            'director_name': director_name,
+            'classification': film['classification'],
+            'release_year': 'N/A',  # Not available
+            'run_time': film['runtime'],
+            'label_issued_by': 'N/A',  # Placeholder
+            'label_issued_on': 'N/A'  # Placeholder
+        }
+    return None
+
+def movie_identity(movie_name, director_name):
+    return {'movie_name': movie_name, 'director_name': director_name}
+
+def movie_input_fields(row):
+    # Result fields that echo the row's input, re-stamped on repeated rows that reuse a result
+    return list(movie_identity(*row).items())
+
+def movie_website_steps(movie_name, director_name, retries=1):
+    # Lookup steps shared by both engines; see lookup_steps
+    base_url = SEARCH_URL
     search_url = base_url + movie_name.replace(" ", "+")
 
     for attempt in range(retries):
         try:
-            browser = start_chrome(search_url, headless=True)
-            time.sleep(5)  # Wait for the page to load
-            page_source = browser.page_source
-            soup = BeautifulSoup(page_source, 'html.parser')
-            listings = soup.find_all('div', {'data-listing': ''})
-
-            for listing in listings:
-                title_tag = listing.find('h3', class_='h2')
-                if not title_tag:
-                    continue
-                title = title_tag.get_text(strip=True)
-
-                director_tag = listing.find('p', class_='small')
-                if not director_tag:
-                    continue
-                director_text = director_tag.get_text(strip=True)
-                if director_name.lower() in director_text.lower():
-                    # Extract classification
-                    classification_tag = listing.find('p', class_='large mb-2')
-                    classification = classification_tag.get_text(strip=True) if classification_tag else 'N/A'
-
-                    # Extract MR (e.g., "Parental guidance recommended for younger viewers")
-                    mr_tag = listing.find('p', class_='large')
-                    mr_text = mr_tag.get_text(strip=True) if mr_tag else 'N/A'
-
-                    # Extract the release year, runtime, label, and label issued on
-                    table = listing.find('table', class_='rating-result-table')
-                    run_time = 'N/A'
-                    label_issued_by = 'N/A'
-                    label_issued_on = 'N/A'
-                    if table:
-                        lines = table.get_text(separator="\n", strip=True).split('\n')
-                        for i, line in enumerate(lines):
-                            if 'Running time:' in line:
-                                run_time = lines[i + 1].strip()
-                            elif 'Label issued by:' in line:
-                                label_issued_by = lines[i + 1].strip()
-                            elif 'Label issued on:' in line:
-                                label_issued_on = lines[i + 1].strip()
-
-                    parts = director_text.split(',')
-                    release_year = parts[0].strip() if len(parts) > 1 else 'N/A'
-
-                    browser.quit()
-                    return {
-                        'movie_name': movie_name,
-                        'director_name': director_name,
-                        'classification': classification,
-                        'release_year': release_year,
-                        'run_time': run_time,
-                        'label_issued_by': label_issued_by,
-                        'label_issued_on': label_issued_on,
-                        'MR': mr_text,  # Additional field for MR
-                        'CD': classification  # Additional field for CD
-                    }
-            browser.quit()
+            # The search page is server-rendered, so a plain GET is usually enough
+            page_source = yield from fetch_or_render(search_url, browser_pool, 'listings', is_search_page)
+
+            details = parse_movie_listings(page_source, movie_name, director_name)
+            if details:
+                return details
         except Exception as e:
             logging.error(f"Error fetching details for {movie_name} from website 1 (attempt {attempt+1}/{retries}): {e}")
-            time.sleep(5)  # Wait before retrying
+            mark_failed(e)
+            yield sleep(5)  # Wait before retrying
     return None
 
-def get_movie_details_from_nz_website(movie_name, director_name, retries=1):
-    base_url = "https://www.fvlb.org.nz/"
-    browser = start_chrome(base_url, headless=True)
+@lookup_cache.cached('classificationoffice', identity=movie_identity)
+def get_movie_details_from_website(movie_name, director_name, retries=1):
+    return run_steps(movie_website_steps(movie_name, director_name, retries))
 
+@lookup_cache.cached_async('classificationoffice', identity=movie_identity)
+async def get_movie_details_from_website_async(movie_name, director_name, retries=1):
+    return await run_steps_async(movie_website_steps(movie_name, director_name, retries))
+
+def movie_nz_website_steps(movie_name, director_name, retries=1):
     for attempt in range(retries):
         try:
-            search_title_input = S("#fvlb-input")
-            exact_match_checkbox = S("#ExactSearch")
-            search_button = S(".submitBtn")
-
-            write(movie_name, into=search_title_input)
-            click(exact_match_checkbox)
-            click(search_button)
-
-            if not wait_for_element(S('.result-title')):
-                browser.quit()
+            movie_links = yield from fvlb_client.search_steps(movie_name, browser_pool)
+            if not movie_links:
                 return None
 
-            time.sleep(3)  # Wait for search results
-
-            movie_links = find_all(S('.result-title'))
-            for link in movie_links:
-                if movie_name.lower() in link.web_element.text.strip().lower():
-                    click(link)
-                    time.sleep(1)
-
-                    page_source = get_driver().page_source
-                    soup = BeautifulSoup(page_source, 'html.parser')
-
-                    title_element = soup.find('h1')
-                    title_name = title_element.text.strip() if title_element else 'N/A'
-
-                    director_element = soup.find('div', class_='film-director')
-                    dir_name = director_element.text.strip().replace('Directed by ', '') if director_element else 'N/A'
-
-                    if director_name.lower() in dir_name.lower():
-                        classification_element = soup.find('div', class_='film-classification')
-                        classification = classification_element.text.strip() if classification_element else 'N/A'
-
-                        runtime_element = soup.find_all('div', class_='film-approved')[1]
-                        runtime = runtime_element.text.strip().replace('This title has a runtime of ', '').replace(' minutes.', 'N/A')
-
-                        browser.quit()
-                        return {
-                            'movie_name': movie_name,
-                            'director_name': director_name,
-                            'classification': classification,
-                            'release_year': 'N/A',  # Not available
-                            'run_time': runtime,
-                            'label_issued_by': 'N/A',  # Placeholder
-                            'label_issued_on': 'N/A'  # Placeholder
-                        }
-
-            browser.back()
+            for link_text, link_url in movie_links:
+                if link_url and movie_name.lower() in link_text.lower():
+                    page_source = yield from fvlb_client.detail_page_steps(link_url, browser_pool)
+                    if not page_source:
+                        continue
+                    details = match_movie_film(fvlb_client.parse_detail_page(page_source), movie_name, director_name)
+                    if details:
+                        return details
         except Exception as e:
             logging.error(f"Error fetching details for {movie_name} from NZ website (attempt {attempt+1}/{retries}): {e}")
-            time.sleep(5)  # Wait before retrying
+            mark_failed(e)
+            yield sleep(5)  # Wait before retrying
 
-    get_driver().quit()
     return None
 
+@lookup_cache.cached('fvlb', identity=movie_identity)
+def get_movie_details_from_nz_website(movie_name, director_name, retries=1):
+    return run_steps(movie_nz_website_steps(movie_name, director_name, retries))
+
+@lookup_cache.cached_async('fvlb', identity=movie_identity)
+async def get_movie_details_from_nz_website_async(movie_name, director_name, retries=1):
+    return await run_steps_async(movie_nz_website_steps(movie_name, director_name, retries))
+
 @app.route('/')
 def index():
     return send_file('index2.html')
 
+def process_movie_row(movie_name, director_name):
+    if not is_valid_director_name(director_name):
+        return {
+            'movie_name': movie_name,
+            'director_name': 'No Director Details',
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'N/A'
+        }
+
+    # Attempt to get details from the first website
+    details = get_movie_details_from_website(movie_name, director_name)
+    if not details:
+        # Attempt to get details from the NZ website
+        details = get_movie_details_from_nz_website(movie_name, director_name)
+
+    # If details are still not found, use default values
+    if not details:
+        details = {
+            'movie_name': movie_name,
+            'director_name': director_name,
+            'classification': 'N/A',
+            'release_year': 'N/A',
+            'run_time': 'N/A',
+            'label_issued_by': 'N/A',
+            'label_issued_on': 'N/A',
+            'MR': 'N/A',
+            'CD': 'N/A'
+        }
+
+    return details
+
+async def process_movie_row_async(movie_name, director_name):
+    if not is_valid_director_name(director_name):
+        # Nothing to look up
+        return process_movie_row(movie_name, director_name)
+
+    # Same order as process_movie_row; awaiting a page lets other rows run in the meantime
+    details = await get_movie_details_from_website_async(movie_name, director_name)
+    if not details:
+        details = await get_movie_details_from_nz_website_async(movie_name, director_name)
+    return details or movie_row_error((movie_name, director_name), None)
+
+def movie_row_error(row, error):
+    movie_name, director_name = row
+    return {
+        'movie_name': movie_name,
+        'director_name': director_name,
+        'classification': 'N/A',
+        'release_year': 'N/A',
+        'run_time': 'N/A',
+        'label_issued_by': 'N/A',
+        'label_issued_on': 'N/A',
+        'MR': 'N/A',
+        'CD': 'N/A'
+    }
+
+def run_movie_job(job, progress, checkpoint=None):
+    # Stream the sheet row by row, reading only the columns the lookup needs
+    progress(rows_total=count_rows(job['input_path']))
+    # The first total is the sheet's size; it is corrected to the rows actually read once reading ends
+    rows = iter_rows(job['input_path'], MOVIE_COLUMNS, on_total=lambda total: progress(rows_total=total))
+
+    filename = job_storage.output_path(job['id'], output_file_path)
+    job_queue.update(job['id'], output_path=filename)
+
+    # Each finished row is appended to the output straight away, so a partial file can be
+    # downloaded while the job runs and a crash doesn't lose the rows already done
+    with open_sink(job_storage.working_path(filename), output_columns) as sink:
+        # Rows are looked up concurrently as they are read; results come back in input order.
+        # Repeated rows are looked up once and the result is copied to every occurrence
+        if async_enabled():
+            # Lookups run as coroutines on the shared event loop, many rows at a time
+            results = iter_results_async(rows, process_movie_row_async, on_error=movie_row_error, on_done=progress,
+                                         checkpoint=checkpoint, dedupe_key=normalized_row,
+                                         input_fields=movie_input_fields)
+        else:
+            results = iter_results(rows, process_movie_row, on_error=movie_row_error, on_done=progress,
+                                   checkpoint=checkpoint, dedupe_key=normalized_row,
+                                   input_fields=movie_input_fields)
+        # MR statements are mapped to codes as each row comes back
+        for details in iter_mapped(results, ['MR']):
+            with timed('sink.write'):
+                sink.write(details)
+    logging.info(f"Lookup cache stats: {lookup_cache.snapshot()}")
+    # Rename into place only once every row is written
+    return job_storage.publish(filename)
+
+job_queue.register('movie', run_movie_job)
+
+# Workers start with the app, so queued and checkpointed jobs resume after a restart without
+# waiting for a request. replay.py imports this module only to call the job handler, so in
+# replay mode no worker may claim real jobs from the shared queue
+if not replay_enabled():
+    job_queue.start_workers()
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     try:
         file = request.files['file']
         if file.filename.endswith('.xlsx'):
-            # Process the Excel file
-            df = pd.read_excel(file)
-            movie_names = df['Movie_name'].tolist()
-            director_names = df['Director_name'].tolist()
-
-            # Mapping MR statements to codes
-            mr_mapping = {
-                "Suitable for general audiences": "G",
-                "Parental guidance recommended for younger viewers": "PG",
-                "Suitable for mature audiences": "M",
-                "Unsuitable for audiences under 13 years of age": "13",
-                "Restricted to persons 13 years and over": "R13",
-                "Restricted to persons 13 years and over unless accompanied by a parent or guardian": "RP13",
-                "Restricted to persons 15 years and over": "R15",
-                "Unsuitable for audiences under 16 years of age": "16",
-                "Restricted to persons 16 years and over": "R16",
-                "Restricted to persons 16 years and over unless accompanied by a parent or guardian": "RP16",
-                "Unsuitable for audiences under 18 years of age": "18",
-                "Restricted to persons 18 years and over": "R18",
-                "Restricted to persons 17 years and over unless accompanied by a parent or guardian": "RP18"
-            }
+            # Queue the sheet and return straight away; progress is polled from /jobs/<job_id>
+            job_id = job_queue.enqueue('movie', file)
 
-            results = []
-            for movie_name, director_name in zip(movie_names, director_names):
-                if not is_valid_director_name(director_name):
-                    results.append({
-                        'movie_name': movie_name,
-                        'director_name': 'No Director Details',
-                        'classification': 'N/A',
-                        'release_year': 'N/A',
-                        'run_time': 'N/A',
-                        'label_issued_by': 'N/A',
-                        'label_issued_on': 'N/A',
-                        'MR': 'N/A',
-                        'CD': 'N/A'
-                    })
-                    continue
-
-                # Attempt to get details from the first website
-                details = get_movie_details_from_website(movie_name, director_name)
-                if not details:
-                    # Attempt to get details from the NZ website
-                    details = get_movie_details_from_nz_website(movie_name, director_name)
-
-                # If details are still not found, use default values
-                if not details:
-                    details = {
-                        'movie_name': movie_name,
-                        'director_name': director_name,
-                        'classification': 'N/A',
-                        'release_year': 'N/A',
-                        'run_time': 'N/A',
-                        'label_issued_by': 'N/A',
-                        'label_issued_on': 'N/A',
-                        'MR': 'N/A',
-                        'CD': 'N/A'
-                    }
-                
-                # Map MR statement to code
-                mr_statement = details.get('MR', 'N/A')
-                details['MR'] = mr_mapping.get(mr_statement, mr_statement)  # Convert MR to code, if possible
-
-                results.append(details)
-
-            # Save the combined results to an Excel file
-            results_df = pd.DataFrame(results)
-            filename = 'movie_ratings.xlsx'
-            results_df.to_excel(filename, index=False)
-
-            return jsonify({'download_url': f'/download/{filename}'})
+            return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
         else:
             return jsonify({'error': 'Invalid file format. Please upload an Excel file with .xlsx extension.'})
     except Exception as e:
         logging.error(f"Error processing upload: {e}")
         return jsonify({'error': 'An error occurred while processing the file. Please try again.'})
 
-@app.route('/download/<filename>')
-def download_file(filename):
-    return send_file(filename, as_attachment=True)
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job id.'}), 404
+    output_path = status.pop('output_path')
+    if status['status'] == 'done':
+        status['download_url'] = f'/download/{job_id}'
+    elif output_path:
+        status['partial_download_url'] = f'/jobs/{job_id}/partial'
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/partial', methods=['GET'])
+def download_partial(job_id):
+    job = job_queue.get(job_id)
+    if job is None or not job['output_path']:
+        return jsonify({'error': 'No output for this job yet.'}), 404
+    if job['status'] == 'done':
+        return send_file(job['output_path'], as_attachment=True)
+    partial_path = partial_path_for(job_storage.working_path(job['output_path']))
+    if not os.path.exists(partial_path):
+        return jsonify({'error': 'No output for this job yet.'}), 404
+    return send_file(partial_path, as_attachment=True)
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    # Re-runs only the rows that failed; finished rows come from the job's checkpoint
+    if not job_queue.retry_failed(job_id):
+        return jsonify({'error': 'Only finished or failed jobs can be retried.'}), 409
+    return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'})
+
+@app.route('/download/<job_id>', methods=['GET'])
+def download_file(job_id):
+    job = job_queue.get(job_id) if job_storage.is_job_id(job_id) else None
+    if job is None or job['status'] != 'done' or not job['output_path'] or not os.path.exists(job['output_path']):
+        return jsonify({'error': 'No finished output for this job.'}), 404
+    return send_file(job['output_path'], as_attachment=True)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(job_queue=job_queue, browser_pool=browser_pool, lookup_cache=lookup_cache),
+                    content_type=metrics.CONTENT_TYPE)
 
 if __name__ == "__main__":
     app.run(debug=True, port=8080)